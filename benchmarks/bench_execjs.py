@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: ascii -*-
+"""Measure the latency and throughput of execjs for every installed runtime.
+
+Usage: python benchmarks/bench_execjs.py [--runtime NAME]... [--quick]
+           [--max-size BYTES] [--baseline FILE] [--threshold RATIO] [--output FILE]
+
+Prints a JSON object with:
+
+- import: the import times measured by bench_import.py.
+- encode: latencies of encode_unicode_codepoints over sources of about 5 MB
+  (500 KB with --quick), "ascii" and "cjk" (mostly non-ASCII).
+- runtimes: for each runtime of execjs.runtimes(), the benchmarks of each
+  execution mode ("oneshot", and "persistent" where supported), or the reason
+  the runtime was skipped. Latencies are {"min", "median", "repeat"} in seconds,
+  throughputs are {"calls_per_second", "threads", "calls"}.
+- comparison (with --baseline): for each latency found in both results,
+  the baseline and current medians and their ratio, and "regressions",
+  the benchmarks whose ratio exceeds --threshold. The exit status is 1
+  if there are regressions.
+
+The benchmarks are:
+
+- cold_eval: eval of a tiny expression in a new context.
+- call_large_context: call of a small function in a context with about 1 MB of source.
+- function_large_context: the same through a Function returned by context.function.
+- call_unicode_context: the same with about 1 MB of mostly non-ASCII source.
+- payload_<size>: call of a function echoing a string argument of <size> bytes,
+  for sizes from 1 KB up to --max-size (100 MB by default; 1 MB with --quick).
+- unicode_source: eval of a source of mostly non-ASCII characters, which runners
+  with encoded sources escape with encode_unicode_codepoints.
+- result_wide: eval returning an array of 100,000 small objects (10,000 with --quick).
+- result_deep: eval returning arrays nested 500 deep.
+- throughput: calls per second from several threads (one-shot contexts)
+  or of an execjs.Pool (persistent contexts).
+"""
+from __future__ import unicode_literals, division, print_function
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import execjs  # noqa: E402
+
+import bench_import  # noqa: E402
+
+LARGE_CONTEXT = "".join(
+    "function f{0}(x) {{ return x * {0} + {0}; }}\n".format(i) for i in range(25000)
+) + "function add(x, y) { return x + y; }\n"
+ECHO_CONTEXT = "function echo(s) { return s; }"
+WIDE_RESULT = "(function() { var a = []; for (var i = 0; i < %d; i++) a.push({id: i, name: 'n' + i}); return a; })()"
+DEEP_RESULT = "(function() { var a = []; for (var i = 0; i < 500; i++) a = [a]; return a; })()"
+UNICODE_SOURCE = "'" + "\u3042\u3044\u3046\u3048\u304a\u00e9\u00fc" * 20000 + "'.length"
+UNICODE_CONTEXT = "".join(
+    "var s{0} = '\u65e5\u672c\u8a9e\u306e\u6587\u5b57\u5217 {0}';\n".format(i) for i in range(40000)
+) + "function add(x, y) { return x + y; }\n"
+
+
+def measure(func, repeat=10, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2], "repeat": repeat}
+
+
+def throughput(func, threads, calls):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(func) for _ in range(calls)]:
+            future.result()
+    return {"calls_per_second": calls / (time.time() - start), "threads": threads, "calls": calls}
+
+
+def sizes(max_size):
+    size = 1000
+    while size <= max_size:
+        yield size
+        size *= 10
+
+
+def bench_mode(runtime, persistent, options):
+    quick = options.quick
+    repeat = 3 if quick else 10
+    results = {}
+
+    def compile(source):
+        return runtime.compile(source, persistent=persistent)
+
+    def cold_eval():
+        context = compile("")
+        try:
+            context.eval("1 + 1")
+        finally:
+            context.close()
+    results["cold_eval"] = measure(cold_eval, repeat)
+
+    with compile(LARGE_CONTEXT) as context:
+        context.call("add", 1, 2)  # start a persistent process before measuring
+        results["call_large_context"] = measure(context.call, repeat, "add", 1, 2)
+        results["function_large_context"] = measure(context.function("add"), repeat, 1, 2)
+
+    with compile(UNICODE_CONTEXT) as context:
+        context.call("add", 1, 2)
+        results["call_unicode_context"] = measure(context.call, repeat, "add", 1, 2)
+
+    with compile(ECHO_CONTEXT) as context:
+        for size in sizes(options.max_size):
+            payload = "x" * size
+            if context.call("echo", payload) != payload:
+                raise AssertionError("echo of {0} bytes failed".format(size))
+            results["payload_{0}".format(size)] = measure(
+                context.call, 3 if size >= 1000000 else repeat, "echo", payload)
+
+        results["unicode_source"] = measure(context.eval, repeat, UNICODE_SOURCE)
+        results["result_wide"] = measure(context.eval, repeat, WIDE_RESULT % (10000 if quick else 100000))
+        results["result_deep"] = measure(context.eval, repeat, DEEP_RESULT)
+
+    threads = 4
+    calls = 20 if quick else 100
+    if persistent:
+        with execjs.Pool(ECHO_CONTEXT, size=threads, runtime=runtime) as pool:
+            pool.call("echo", "x")
+            results["throughput"] = throughput(lambda: pool.call("echo", "x"), threads, calls)
+    else:
+        context = compile(ECHO_CONTEXT)
+        results["throughput"] = throughput(lambda: context.call("echo", "x"), threads, calls)
+    return results
+
+
+def bench_encode(options):
+    from execjs._misc import encode_unicode_codepoints
+    size = 500000 if options.quick else 5000000
+    cjk = "\u3042\u3044\u3046\u3048\u304a\u4e16\u754c abc"
+    sources = {
+        "ascii": "x" * size,
+        "cjk": (cjk * (size // len(cjk) + 1))[:size],
+    }
+    return dict(
+        (name, measure(encode_unicode_codepoints, 3 if options.quick else 10, source))
+        for name, source in sources.items()
+    )
+
+
+def bench_runtime(runtime, options):
+    if not runtime.is_available():
+        return {"skipped": "not installed"}
+
+    results = {}
+    modes = [("oneshot", False)]
+    if getattr(runtime, "supports_persistent", lambda: False)():
+        modes.append(("persistent", True))
+    for mode, persistent in modes:
+        try:
+            results[mode] = bench_mode(runtime, persistent, options)
+        except execjs.Error as e:
+            results[mode] = {"skipped": "{0}: {1}".format(type(e).__name__, e)}
+    return results
+
+
+def latencies(results, prefix=()):
+    '''Yield (path, median) for every latency in results.'''
+    for key, value in sorted(results.items()):
+        if isinstance(value, dict):
+            if "median" in value:
+                yield "/".join(prefix + (key,)), value["median"]
+            else:
+                for item in latencies(value, prefix + (key,)):
+                    yield item
+
+
+def compare(baseline, current, threshold):
+    base = dict(latencies(baseline))
+    comparison = {}
+    regressions = []
+    for path, median in latencies(current):
+        if path in base and base[path] > 0:
+            ratio = median / base[path]
+            comparison[path] = {"baseline": base[path], "current": median, "ratio": ratio}
+            if ratio > threshold:
+                regressions.append(path)
+    return {"latencies": comparison, "threshold": threshold, "regressions": regressions}
+
+
+def run(options):
+    names = options.runtime or list(execjs.runtimes())
+    all_runtimes = dict((name.lower(), (name, runtime)) for name, runtime in execjs.runtimes().items())
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "import": bench_import.run(repeat=5 if options.quick else 20),
+        "encode": bench_encode(options),
+        "runtimes": {},
+    }
+    for name in names:
+        if name.lower() not in all_runtimes:
+            results["runtimes"][name] = {"skipped": "unknown runtime"}
+            continue
+        name, runtime = all_runtimes[name.lower()]
+        results["runtimes"][name] = bench_runtime(runtime, options)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runtime", action="append", help="runtime to measure (default: all)")
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions and payloads up to 1 MB")
+    parser.add_argument("--max-size", type=int, help="largest payload in bytes")
+    parser.add_argument("--baseline", help="JSON output of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio of medians above which a benchmark is a regression (default: 1.2)")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    options = parser.parse_args()
+    if options.max_size is None:
+        options.max_size = 1000000 if options.quick else 100000000
+
+    results = run(options)
+    if options.baseline:
+        with open(options.baseline) as fp:
+            results["comparison"] = compare(json.load(fp), results, options.threshold)
+
+    if options.output:
+        with open(options.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    if results.get("comparison", {}).get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: ascii -*-
+"""Measure the wall time of `import execjs` in fresh interpreters.
+
+Prints a JSON object with the minimum and median seconds of several runs of
+`import execjs` alone, and of `import execjs; execjs.get()` with and without
+a warm discovery cache (EXECJS_DISCOVERY_CACHE).
+"""
+from __future__ import unicode_literals, division, print_function
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# `python -c` puts its working directory first on sys.path, so running the
+# interpreters in the root of the repository measures this checkout of execjs.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = "import time; t = time.time(); import execjs; print(time.time() - t)"
+IMPORT_AND_GET = "import time; t = time.time(); import execjs; execjs.get(); print(time.time() - t)"
+
+
+def measure(code, repeat=20, env=None):
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], env=env, cwd=ROOT)
+        times.append(float(output))
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2]}
+
+
+def run(repeat=20):
+    results = {
+        "import": measure(IMPORT, repeat),
+        "import_and_get": measure(IMPORT_AND_GET, repeat),
+    }
+
+    fd, cache = tempfile.mkstemp(prefix="execjs-discovery", suffix=".json")
+    os.close(fd)
+    os.remove(cache)
+    try:
+        env = dict(os.environ, EXECJS_DISCOVERY_CACHE=cache)
+        subprocess.check_call([sys.executable, "-c", "import execjs; execjs.get()"], env=env, cwd=ROOT)
+        results["import_and_get_with_discovery_cache"] = measure(IMPORT_AND_GET, repeat, env=env)
+    finally:
+        if os.path.exists(cache):
+            os.remove(cache)
+    return results
+
+
+def main():
+    json.dump(run(), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,36 +27,85 @@ from execjs._exceptions import (
     RuntimeError,
     ProgramError,
     RuntimeUnavailableError,
+    TimeoutError,
 )
 
+import importlib
+import sys
+
 import execjs._runtimes
 from execjs._external_runtime import ExternalRuntime
 from execjs._abstract_runtime import AbstractRuntime
+from execjs._abstract_runtime_context import Function
 
 
 __all__ = """
     get register runtimes get_from_environment exec_ eval compile
-    ExternalRuntime
-    Error RuntimeError ProgramError RuntimeUnavailableError
+    exec_async eval_async
+    ExternalRuntime Function Pool LRU Supervisor
+    add_listener remove_listener CallEvent Stats
+    Error RuntimeError ProgramError RuntimeUnavailableError TimeoutError
 """.split()
 
 
+# Attributes imported on first use, to keep their modules out of the import time of execjs.
+_lazy_attributes = {
+    'Pool': 'execjs._pool',
+    'LRU': 'execjs._lru',
+    'Supervisor': 'execjs._supervisor',
+    'add_listener': 'execjs._instrumentation',
+    'remove_listener': 'execjs._instrumentation',
+    'CallEvent': 'execjs._instrumentation',
+    'Stats': 'execjs._instrumentation',
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError("module 'execjs' has no attribute {0!r}".format(name))
+    value = getattr(importlib.import_module(_lazy_attributes[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
+
+
+if sys.version_info < (3, 7):
+    # modules have no __getattr__ before Python 3.7
+    for _name in _lazy_attributes:
+        __getattr__(_name)
+
+
 register = execjs._runtimes.register
 get = execjs._runtimes.get
 runtimes = execjs._runtimes.runtimes
 get_from_environment = execjs._runtimes.get_from_environment
 
 
-def eval(source, cwd=None):
-    return get().eval(source, cwd)
+def eval(source, cwd=None, timeout=None, max_memory=None, max_cpu_seconds=None):
+    return get().eval(source, cwd, timeout, max_memory, max_cpu_seconds)
 eval.__doc__ = AbstractRuntime.eval.__doc__
 
 
-def exec_(source, cwd=None):
-    return get().exec_(source, cwd)
+def exec_(source, cwd=None, timeout=None, max_memory=None, max_cpu_seconds=None):
+    return get().exec_(source, cwd, timeout, max_memory, max_cpu_seconds)
 exec_.__doc__ = AbstractRuntime.exec_.__doc__
 
 
-def compile(source, cwd=None):
-    return get().compile(source, cwd)
+def eval_async(source, cwd=None):
+    return get().eval_async(source, cwd)
+eval_async.__doc__ = AbstractRuntime.eval_async.__doc__
+
+
+def exec_async(source, cwd=None):
+    return get().exec_async(source, cwd)
+exec_async.__doc__ = AbstractRuntime.exec_async.__doc__
+
+
+def compile(source, cwd=None, persistent=False, cache_dir=None, cache=None,
+            timeout=None, max_memory=None, max_cpu_seconds=None, multiplexed=False, supervisor=None):
+    return get().compile(
+        source, cwd, persistent, cache_dir, cache, timeout, max_memory, max_cpu_seconds, multiplexed, supervisor)
 compile.__doc__ = AbstractRuntime.compile.__doc__
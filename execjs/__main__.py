@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: ascii -*-
 from __future__ import unicode_literals
+from collections import deque
 import sys
 import io
+import json
+import threading
 from argparse import ArgumentParser, Action, SUPPRESS
 
 import execjs
@@ -29,6 +32,16 @@ def main():
     parser.add_argument('-r', '--runtime', action='store', dest='runtime')
     parser.add_argument('-e', '--eval', action='store', dest='expr')
     parser.add_argument("--encoding", action="store", dest="files_encoding", default="utf8")
+    parser.add_argument(
+        '--serve', '--ndjson', action='store_true', dest='serve',
+        help='answer one JSON request per line of stdin, {"eval": source} or {"call": name, "args": [...]}, '
+             'with one JSON response per line')
+    parser.add_argument(
+        '-j', '--jobs', action='store', dest='jobs', type=int, default=1,
+        help='number of requests served in parallel in --serve mode')
+    parser.add_argument(
+        '--unordered', action='store_true', dest='unordered',
+        help='write responses as they are ready instead of in the order of the requests')
     parser.add_argument(nargs="*", action='store', dest='files')
 
     opts = parser.parse_args()
@@ -40,6 +53,10 @@ def main():
         with io.open(f, encoding=opts.files_encoding) as fp:
             codes.append(fp.read())
 
+    if opts.serve:
+        serve(runtime, "\n".join(codes), jobs=opts.jobs, ordered=not opts.unordered)
+        return
+
     context = runtime.compile("\n".join(codes))
     if opts.expr:
         if isinstance(opts.expr, bytes):
@@ -51,5 +68,90 @@ def main():
         ret = context.eval(sys.stdin.read())
         sys.stdout.write(repr(ret) + "\n")
 
+def serve(runtime, source, jobs=1, ordered=True, input=None, output=None):
+    """Answer NDJSON requests from input (stdin) on output (stdout).
+
+    Each line of input is a JSON object {"eval": source} or {"call": name, "args": [...]}.
+    Each response is a line {"result": value}, or {"error": class name, "message": message}
+    if the request failed. An "id" member of a request is copied to its response.
+    Runtimes supporting persistent contexts load source once per job.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+
+    input = input or sys.stdin
+    output = output or sys.stdout
+    requests = (line for line in input if line.strip())
+
+    def write(response):
+        output.write(response + "\n")
+        output.flush()
+
+    persistent = getattr(runtime, "supports_persistent", lambda: False)()
+    contexts = []
+    local = threading.local()
+
+    def respond(line):
+        # each thread has its own persistent context; one-shot contexts are shared
+        context = getattr(local, "context", None)
+        if context is None:
+            if persistent or not contexts:
+                contexts.append(runtime.compile(source, persistent=persistent))
+            context = local.context = contexts[-1]
+        return _respond(context, line)
+
+    try:
+        if jobs <= 1:
+            for line in requests:
+                write(respond(line))
+            return
+
+        # at most this many requests are read ahead of the written responses
+        window = jobs * 4
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            if ordered:
+                pending = deque()
+                for line in requests:
+                    pending.append(executor.submit(respond, line))
+                    if len(pending) >= window:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+            else:
+                pending = set()
+                for line in requests:
+                    pending.add(executor.submit(respond, line))
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            write(future.result())
+                for future in as_completed(pending):
+                    write(future.result())
+    finally:
+        for context in contexts:
+            context.close()
+
+
+def _respond(target, line):
+    request = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        if "call" in request:
+            response = {"result": target.call(request["call"], *request.get("args", []))}
+        elif "eval" in request:
+            response = {"result": target.eval(request["eval"])}
+        else:
+            raise ValueError("request must have an 'eval' or 'call' member")
+        if "id" in request:
+            response["id"] = request["id"]
+        return json.dumps(response)
+    except (execjs.Error, ValueError, TypeError) as e:
+        response = {"error": type(e).__name__, "message": "{0}".format(e)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return json.dumps(response)
+
+
 if "__main__" == __name__:
     main()
@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractmethod
 import six
 import execjs._exceptions as exceptions
+from execjs._limits import Limits
 
 
 @six.add_metaclass(ABCMeta)
@@ -8,36 +9,84 @@ class AbstractRuntime(object):
     '''
     Abstract base class for runtime class.
     '''
-    def exec_(self, source, cwd=None):
+    def exec_(self, source, cwd=None, timeout=None, max_memory=None, max_cpu_seconds=None):
         '''Execute source by JavaScript runtime and return all output to stdout as a string.
 
         source -- JavaScript code to execute.
         cwd -- Directory where call JavaScript runtime. It may be ignored in some derived class.
+        timeout, max_memory, max_cpu_seconds -- Limits of the call (see compile).
         '''
-        return self.compile('', cwd=cwd).exec_(source)
+        return self.compile('', cwd=cwd).exec_(
+            source, timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
 
-    def eval(self, source, cwd=None):
+    def eval(self, source, cwd=None, timeout=None, max_memory=None, max_cpu_seconds=None):
         '''Evaluate source in JavaScript runtime.
 
         source -- JavaScript code to evaluate.
         cwd -- Directory where call JavaScript runtime. It may be ignored in some derived class.
+        timeout, max_memory, max_cpu_seconds -- Limits of the call (see compile).
         '''
-        return self.compile('', cwd=cwd).eval(source)
+        return self.compile('', cwd=cwd).eval(
+            source, timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
 
-    def compile(self, source, cwd=None):
+    def exec_async(self, source, cwd=None, **limits):
+        '''Coroutine version of exec_. Cancelling it terminates the runtime process, if any.'''
+        return self.compile('', cwd=cwd).exec_async(source, **limits)
+
+    def eval_async(self, source, cwd=None, **limits):
+        '''Coroutine version of eval. Cancelling it terminates the runtime process, if any.'''
+        return self.compile('', cwd=cwd).eval_async(source, **limits)
+
+    def compile(self, source, cwd=None, persistent=False, cache_dir=None, cache=None,
+                timeout=None, max_memory=None, max_cpu_seconds=None, multiplexed=False, supervisor=None):
         '''Bulk source as a context object. The source can be used to execute another code.
 
         source -- JavaScript code to bulk.
         cwd -- Directory where call JavaScript runtime. It may be ignored in some derived class.
+        persistent -- If true, load source once into a long-lived runtime process which serves
+            all later calls. Close the context to terminate the process.
+        cache_dir -- Directory to keep the runtime's compiled code cache of source in,
+            so that later processes skip compiling it. It may be ignored in some derived class.
+        cache -- execjs.LRU which caches results of eval and call made with pure=True.
+            It may be shared by several contexts.
+        timeout -- Default number of seconds after which exec_, eval and call are aborted
+            with execjs.TimeoutError, killing the runtime process.
+        max_memory -- Default maximum size in bytes of the data memory of runtime processes.
+        max_cpu_seconds -- Default maximum CPU time of runtime processes; exceeding it
+            raises execjs.TimeoutError. In persistent contexts it bounds each call like timeout.
+            Each call may override these limits. Memory and CPU limits are enforced
+            on POSIX systems only; a persistent process keeps the memory limit given here.
+            They may be ignored in some derived class.
+        multiplexed -- If true, return a persistent context which serves calls from many
+            threads at once over one runtime process, awaiting Promises returned by JavaScript
+            (see ExternalRuntime.MultiplexedContext).
+        supervisor -- execjs.Supervisor managing the process of a persistent context:
+            starting it in advance, checking it and replacing it.
+            It may be ignored in some derived class.
         '''
         if not self.is_available():
             raise exceptions.RuntimeUnavailableError
-        return self._compile(source, cwd=cwd)
+        context = self._compile(
+            source, cwd=cwd, persistent=persistent, cache_dir=cache_dir, multiplexed=multiplexed, supervisor=supervisor)
+        limits = Limits(timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
+        if limits:
+            context._default_limits = limits
+        if cache is not None:
+            import hashlib
+            context._result_cache = cache
+            context._result_cache_prefix = hashlib.sha256(source.encode('utf8')).hexdigest()
+        context._prewarm()
+        return context
 
     @abstractmethod
     def is_available(self):
         raise NotImplementedError
 
     @abstractmethod
-    def _compile(self, source, cwd=None):
+    def _compile(self, source, cwd=None, persistent=False, cache_dir=None, multiplexed=False, supervisor=None):
         raise NotImplementedError
+
+    def _identity(self):
+        # Strings identifying the installation of the runtime, such as its executable and version,
+        # which key its calibration results (see execjs._calibration).
+        return []
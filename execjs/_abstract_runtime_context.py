@@ -1,40 +1,234 @@
 import execjs
+import json
+import execjs._instrumentation as _instrumentation
+import execjs._limits as _limits
 from abc import ABCMeta, abstractmethod
 import six
 
 
+_call_many_source = '''\
+return (function(fn, argsList) {{
+  var results = [];
+  for (var i = 0; i < argsList.length; i++) {{
+    try {{
+      results.push(['ok', fn.apply(this, argsList[i])]);
+    }} catch (err) {{
+      results.push(['err', '' + err]);
+    }}
+  }}
+  return results;
+}})({identifier}, {args_list})'''
+
+
+# Iterables which are not arrays, such as generators, do not survive JSON,
+# so they are collected into an array by the runtime.
+_call_iter_source = '''\
+return (function(result) {{
+  if (Array.isArray(result)) {{
+    return result;
+  }}
+  if (typeof Symbol != "function" || result == null || typeof result[Symbol.iterator] != "function") {{
+    throw new TypeError("{identifier} did not return an array or an iterable");
+  }}
+  var items = [];
+  var iterator = result[Symbol.iterator]();
+  for (var step = iterator.next(); !step.done; step = iterator.next()) {{
+    items.push(step.value);
+  }}
+  return items;
+}})({identifier}.apply(this, {args}))'''
+
+
+_arity_source = '(function(f) {{ return [typeof f, typeof f == "function" ? f.length : null]; }})({name})'
+
+
 @six.add_metaclass(ABCMeta)
 class AbstractRuntimeContext(object):
     '''
     Abstract base class for runtime context class.
     '''
-    def exec_(self, source):
+    # set by AbstractRuntime.compile(source, cache=...)
+    _result_cache = None
+    _result_cache_prefix = None
+    # set by AbstractRuntime.compile(source, timeout=..., ...)
+    _default_limits = _limits.Limits()
+    # name of the runtime in the events of execjs.add_listener
+    _runtime_name = None
+
+    def exec_(self, source, timeout=None, max_memory=None, max_cpu_seconds=None):
         '''Execute source by JavaScript runtime and return all output to stdout as a string.
 
         source -- JavaScript code to execute.
+        timeout, max_memory, max_cpu_seconds -- Limits of this call, overriding
+            those given to compile (see AbstractRuntime.compile).
         '''
         if not self.is_available():
             raise execjs.RuntimeUnavailableError
-        return self._exec_(source)
+        limits = dict(timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
+        with _instrumentation.measured(self._runtime_name, 'exec'), _limits.applied(self._default_limits, **limits):
+            return self._exec_(source)
 
-    def eval(self, source):
+    def eval(self, source, pure=False, timeout=None, max_memory=None, max_cpu_seconds=None):
         '''Evaluate source in JavaScript runtime.
 
         source -- JavaScript code to evaluate.
+        pure -- If true, the result may be served from and stored in the result cache of the context.
+        timeout, max_memory, max_cpu_seconds -- Limits of this call, overriding
+            those given to compile (see AbstractRuntime.compile).
         '''
         if not self.is_available():
             raise execjs.RuntimeUnavailableError
-        return self._eval(source)
+        limits = dict(timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
+        with _instrumentation.measured(self._runtime_name, 'eval'), _limits.applied(self._default_limits, **limits):
+            if pure and self._result_cache is not None:
+                return self._cached(('eval', source), self._eval, source)
+            return self._eval(source)
 
-    def call(self, name, *args):
+    def call(self, name, *args, **kwargs):
         '''Call a JavaScript function in context.
 
         name -- Name of funtion object to call
         args -- Arguments for the funtion object
+        pure -- (keyword only) If true, the result may be served from and stored
+            in the result cache of the context.
+        timeout, max_memory, max_cpu_seconds -- (keyword only) Limits of this call,
+            overriding those given to compile (see AbstractRuntime.compile).
+        '''
+        return self._call_with_options('call', self._call, name, args, kwargs)
+
+    def function(self, name):
+        '''Return a Function calling a JavaScript function in context.
+
+        The function is looked up once, and an error is raised if it does not exist.
+        Calls of the Function skip building and parsing a program for each call
+        where the runtime allows, which makes them cheaper than call in persistent contexts.
+
+        name -- Name of funtion object to bind
         '''
         if not self.is_available():
             raise execjs.RuntimeUnavailableError
-        return self._call(name, *args)
+        with _limits.applied(self._default_limits):
+            invoke, arity = self._bind(name)
+        return Function(self, name, invoke, arity)
+
+    def invalidate(self, name=None):
+        '''Remove the cached results of the context; only those of calls to name if it is given.'''
+        if self._result_cache is not None:
+            prefix = (self._result_cache_prefix,)
+            if name is not None:
+                prefix += ('call', name)
+            self._result_cache.invalidate(prefix)
+
+    def call_many(self, name, args_list):
+        '''Call a JavaScript function once for each argument tuple, in a single runtime invocation.
+
+        Return a list of results in the same order. An item whose call threw an exception
+        is a ProgramError instance instead of a result, so one failure does not fail the batch.
+
+        name -- Name of funtion object to call
+        args_list -- Iterable of argument tuples
+        '''
+        if not self.is_available():
+            raise execjs.RuntimeUnavailableError
+        return self._call_many(name, [list(args) for args in args_list])
+
+    def map(self, name, iterable, chunksize=100, processes=None, ordered=True, return_exceptions=False):
+        '''Call a JavaScript function with each item of an iterable and iterate over the results.
+
+        Items are read lazily and sent in chunks with call_many, to several runtime processes
+        in parallel. At most two chunks per process are read ahead of the results consumed,
+        so iterables larger than memory can be mapped. Persistent contexts start a copy of
+        their process for each extra process before map returns, and close them when the
+        iteration ends or the iterator is closed.
+
+        name -- Name of funtion object to call with each item as its only argument
+        iterable -- Iterable of the items
+        chunksize -- Number of items sent in each call_many
+        processes -- Number of chunks run in parallel. Defaults to the number of CPUs.
+        ordered -- If false, the results of each chunk are yielded as soon as it is done,
+            instead of in the order of the items.
+        return_exceptions -- If true, an item whose call threw an exception yields a ProgramError
+            instance as its result, like call_many. Otherwise the ProgramError is raised.
+        '''
+        if not self.is_available():
+            raise execjs.RuntimeUnavailableError
+        import execjs._map as _map
+        return _map.imap(
+            self, name, iterable, chunksize=chunksize, processes=processes,
+            ordered=ordered, return_exceptions=return_exceptions,
+        )
+
+    def imap_unordered(self, name, iterable, chunksize=100, processes=None, return_exceptions=False):
+        '''Same as map with ordered=False.'''
+        return self.map(name, iterable, chunksize, processes, False, return_exceptions)
+
+    def call_iter(self, name, *args):
+        '''Call a JavaScript function and iterate over the items of its result.
+
+        The function may return an array or any iterable, such as a generator.
+        Runtimes that support it stream the items one by one as they are produced.
+
+        name -- Name of funtion object to call
+        args -- Arguments for the funtion object
+        '''
+        if not self.is_available():
+            raise execjs.RuntimeUnavailableError
+        return self._call_iter(name, *args)
+
+    def exec_async(self, source, timeout=None, max_memory=None, max_cpu_seconds=None):
+        '''Coroutine version of exec_. Cancelling it terminates the runtime process, if any.
+
+        source -- JavaScript code to execute.
+        timeout, max_memory, max_cpu_seconds -- Limits of this call (see exec_).
+        '''
+        limits = dict(timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
+        return self._measured_async('exec', None, limits, self._exec_async, source)
+
+    def eval_async(self, source, timeout=None, max_memory=None, max_cpu_seconds=None):
+        '''Coroutine version of eval. Cancelling it terminates the runtime process, if any.
+
+        source -- JavaScript code to evaluate.
+        timeout, max_memory, max_cpu_seconds -- Limits of this call (see eval).
+        '''
+        limits = dict(timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds)
+        return self._measured_async('eval', None, limits, self._eval_async, source)
+
+    def call_async(self, name, *args, **kwargs):
+        '''Coroutine version of call. Cancelling it terminates the runtime process, if any.
+
+        name -- Name of funtion object to call
+        args -- Arguments for the funtion object
+        timeout, max_memory, max_cpu_seconds -- (keyword only) Limits of this call (see call).
+        '''
+        limits = dict((key, kwargs.pop(key, None)) for key in ('timeout', 'max_memory', 'max_cpu_seconds'))
+        if kwargs:
+            raise TypeError("call_async() got an unexpected keyword argument '{0}'".format(next(iter(kwargs))))
+        return self._measured_async('call', name, limits, self._call_async, name, *args)
+
+    def derive(self, source):
+        '''Return a new context running source on top of the source of this one.
+
+        The derived context sees the functions and variables of this context,
+        while the declarations of its own source are its own. Contexts which keep
+        their source loaded (persistent contexts and PyV8) share it with derived
+        contexts, so only source is loaded for each of them.
+        The limits given to compile apply to the derived context too.
+
+        source -- JavaScript code to run on top of this context.
+        '''
+        context = self._derive(source)
+        context._default_limits = self._default_limits
+        return context
+
+    def close(self):
+        '''Release resources held by the context, such as runtime processes.'''
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     @abstractmethod
     def is_available(self):
@@ -51,3 +245,130 @@ class AbstractRuntimeContext(object):
     @abstractmethod
     def _call(self, name, *args):
         raise NotImplementedError
+
+    def _call_with_options(self, method, func, name, args, kwargs):
+        # Serve func(name, *args) with the keyword-only options of call in kwargs.
+        pure = kwargs.pop('pure', False)
+        limits = dict((key, kwargs.pop(key, None)) for key in ('timeout', 'max_memory', 'max_cpu_seconds'))
+        if kwargs:
+            raise TypeError("{0}() got an unexpected keyword argument '{1}'".format(method, next(iter(kwargs))))
+
+        if not self.is_available():
+            raise execjs.RuntimeUnavailableError
+        measured = _instrumentation.measured(self._runtime_name, 'call', name)
+        with measured, _limits.applied(self._default_limits, **limits):
+            if pure and self._result_cache is not None:
+                try:
+                    key = ('call', name, json.dumps(args, sort_keys=True, separators=(',', ':')))
+                except TypeError:
+                    pass  # arguments which cannot be a key, such as binary data
+                else:
+                    return self._cached(key, func, name, *args)
+            return func(name, *args)
+
+    def _cached(self, key, func, *args):
+        key = (self._result_cache_prefix,) + key
+        found, value = self._result_cache.get(key)
+        if not found:
+            value = func(*args)
+            self._result_cache.put(key, value)
+        return value
+
+    def _call_iter(self, identifier, *args):
+        source = _call_iter_source.format(identifier=identifier, args=json.dumps(args))
+        return iter(self._exec_(source))
+
+    def _prewarm(self):
+        # Start the resources of the context in advance if it is configured to; called once it is set up.
+        pass
+
+    def _replicate(self):
+        # Return a context equivalent to this one, which can serve calls in parallel with it.
+        # The caller closes it if it is not self.
+        return self
+
+    def _derive(self, source):
+        raise NotImplementedError("{0} does not support derive".format(type(self).__name__))
+
+    def _bind(self, name):
+        # Return (invoke, arity) of the function name, where invoke(args) calls it.
+        arity = self._arity(name)
+        return (lambda args: self._call(name, *args)), arity
+
+    def _arity(self, name):
+        kind, arity = self._eval(_arity_source.format(name=name))
+        if kind != 'function':
+            raise execjs.ProgramError("TypeError: {0} is not a function".format(name))
+        return arity
+
+    def _call_many(self, identifier, args_list):
+        try:
+            source = _call_many_source.format(identifier=identifier, args_list=json.dumps(args_list))
+        except TypeError:
+            # arguments which cannot be written into a program, such as binary data
+            return self._call_each(identifier, args_list)
+        return [
+            value if status == 'ok' else execjs.ProgramError(value)
+            for status, value in self._exec_(source)
+        ]
+
+    def _call_each(self, identifier, args_list):
+        # call_many one call at a time
+        results = []
+        for args in args_list:
+            try:
+                results.append(self._call(identifier, *args))
+            except execjs.ProgramError as e:
+                results.append(e)
+        return results
+
+    def _measured_async(self, op, name, limits, func, *args):
+        # Return the coroutine func(*args), created with the limits applied, and measured
+        # as one event without phases: the current event of a thread cannot follow a coroutine.
+        import execjs._async as _async
+        if not self.is_available():
+            raise execjs.RuntimeUnavailableError
+        with _limits.applied(self._default_limits, **limits):
+            coroutine = func(*args)
+        return _async.measured(self._runtime_name, op, name, coroutine)
+
+    # Derived classes without a native asynchronous transport run the
+    # blocking methods in the default executor of the event loop,
+    # which holds a thread for each pending call. The methods are called
+    # with the limits of the call applied, and must read them right away.
+    def _exec_async(self, source):
+        import execjs._async as _async
+        return _async.run_in_executor(_limits.bound(self._exec_), source)
+
+    def _eval_async(self, source):
+        import execjs._async as _async
+        return _async.run_in_executor(_limits.bound(self._eval), source)
+
+    def _call_async(self, name, *args):
+        import execjs._async as _async
+        return _async.run_in_executor(_limits.bound(self._call), name, *args)
+
+
+class Function(object):
+    '''A JavaScript function of a context, returned by AbstractRuntimeContext.function.
+
+    Calling it is equivalent to context.call(name, *args), and takes the same keyword-only options.
+
+    name -- Name of the function.
+    arity -- Number of parameters the function declares (its length in JavaScript).
+        It is informational, as JavaScript functions accept any number of arguments.
+    '''
+    def __init__(self, context, name, invoke, arity):
+        self.context = context
+        self.name = name
+        self.arity = arity
+        self._invoke = invoke
+
+    def __call__(self, *args, **kwargs):
+        return self.context._call_with_options(self.name, self._call, self.name, args, kwargs)
+
+    def __repr__(self):
+        return "<execjs.Function {0} of {1!r}>".format(self.name, self.context)
+
+    def _call(self, name, *args):
+        return self._invoke(args)
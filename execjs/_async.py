@@ -0,0 +1,161 @@
+'''Coroutines behind the *_async methods of runtimes and contexts (Python 3.5+).'''
+import asyncio
+import copy
+import functools
+import locale
+import os
+import time
+from asyncio.subprocess import PIPE
+
+from execjs._exceptions import TimeoutError
+import execjs._instrumentation as _instrumentation
+import execjs._limits as _limits
+
+
+async def measured(runtime, op, name, coroutine):
+    '''Await coroutine, measured as one CallEvent without phases (see _instrumentation.measured).'''
+    if not _instrumentation._listeners:
+        return await coroutine
+    event = _instrumentation.CallEvent(runtime, op, name)
+    start = time.time()
+    try:
+        return await coroutine
+    except Exception as e:
+        event.error = e
+        raise
+    finally:
+        event.seconds = time.time() - start
+        _instrumentation.notify(event)
+
+
+async def run_in_executor(func, *args):
+    '''Run a blocking function in the default executor of the running loop.'''
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+async def run_in_executor_or_kill(worker, func, *args):
+    '''Like run_in_executor, but kill the process of worker if cancelled.'''
+    try:
+        return await run_in_executor(func, *args)
+    except asyncio.CancelledError:
+        worker.kill()
+        raise
+
+
+async def serve_multiplexed(context, limits, op, **fields):
+    '''_serve of a MultiplexedContext, without a thread per call.
+
+    The response is routed to the event loop by the reader thread of the worker.
+    Cancelling the coroutine abandons the request: its response is discarded,
+    while the process and the other requests in flight are not affected.
+    Exceeding limits.timeout kills the process, as in the blocking version.
+    '''
+    worker = context._worker
+    if not worker.alive:
+        # starting the process and loading the source block
+        status, value = await run_in_executor(worker.start)
+        if status != 'ok':
+            return context._result(status, value)
+    waiter = _FutureWaiter(asyncio.get_event_loop())
+    status, value, process, abandon = worker._submit(op, fields, waiter)
+    if process is None:
+        return context._result(status, value)
+    try:
+        status, value = await asyncio.wait_for(waiter.future, limits.timeout)
+    except asyncio.TimeoutError:
+        abandon()
+        _limits.kill(process)
+        # so that the next request starts a new process, as after Worker.kill
+        await run_in_executor(process.wait)
+        raise TimeoutError("JavaScript did not finish within {0} seconds".format(limits.timeout))
+    except asyncio.CancelledError:
+        abandon()
+        raise
+    worker._served_by(process)
+    return context._result(status, value)
+
+
+class _FutureWaiter(object):
+    '''Waiter of a MultiplexedWorker which resolves a future of an event loop.'''
+    def __init__(self, loop):
+        self._loop = loop
+        self.future = loop.create_future()
+
+    def set(self, result):
+        self._call_soon(self._resolve, result, None)
+
+    def fail(self, error):
+        # a copy for each request, as the traceback is set on the exception raised
+        self._call_soon(self._resolve, None, copy.copy(error))
+
+    def _call_soon(self, *args):
+        try:
+            self._loop.call_soon_threadsafe(*args)
+        except RuntimeError:
+            pass  # the loop is closed; nobody waits for the response
+
+    def _resolve(self, result, error):
+        if self.future.done():
+            return  # cancelled
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+async def communicate(cmd, input=None, cwd=None, **popen_options):
+    '''Run cmd to completion and return (returncode, stdout, stderr) as text.
+
+    input -- List of byte strings to write to stdin.
+    The process is killed if the coroutine is cancelled.
+    '''
+    p = await asyncio.create_subprocess_exec(
+        *cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=cwd, **popen_options)
+    try:
+        try:
+            for chunk in input or ():
+                p.stdin.write(chunk)
+                await p.stdin.drain()
+            p.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the runtime exited early; its status is checked by the caller
+        stdoutdata, stderrdata = await p.communicate()
+    except asyncio.CancelledError:
+        if p.returncode is None:
+            p.kill()
+            await p.wait()
+        raise
+
+    # same decoding as Popen(universal_newlines=True)
+    encoding = locale.getpreferredencoding(False)
+    return p.returncode, stdoutdata.decode(encoding), stderrdata.decode(encoding)
+
+
+async def _communicate_within(limits, *args, **kwargs):
+    try:
+        return await asyncio.wait_for(communicate(*args, **kwargs), limits.timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError("JavaScript did not finish within {0} seconds".format(limits.timeout))
+
+
+async def exec_context(context, limits, source):
+    '''exec_ of ExternalRuntime.Context with limits over an asyncio subprocess.'''
+    cmd = context._runtime._binary()
+    with context._code_cache_load():
+        if context._tempfile:
+            filename = context._write_tempfile(source)
+            try:
+                ret, stdoutdata, stderrdata = await _communicate_within(
+                    limits, cmd + [filename], cwd=context._cwd, **limits.popen_options())
+            finally:
+                os.remove(filename)
+        else:
+            encoding = locale.getpreferredencoding(False)
+            input = [chunk.encode(encoding) for chunk in context._compile(source)]
+            ret, stdoutdata, stderrdata = await _communicate_within(
+                limits, cmd, input, cwd=context._cwd, **limits.popen_options())
+
+    limits.check(ret)
+    context._fail_on_non_zero_status(ret, stdoutdata, stderrdata)
+    return context._extract_result(stdoutdata)
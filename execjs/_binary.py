@@ -0,0 +1,86 @@
+'''Transfer of binary data between Python and persistent runtime processes.
+
+Binary values are taken out of the JSON document of a message and replaced by
+{"$execjs_binary": index, "type": type} placeholders. Their bytes follow the
+JSON line as separate blobs.
+'''
+import six
+
+
+BINARY_KEY = '$execjs_binary'
+
+# numpy dtype name <-> JavaScript typed array
+_typed_arrays = {
+    'int8': 'Int8Array',
+    'uint8': 'Uint8Array',
+    'int16': 'Int16Array',
+    'uint16': 'Uint16Array',
+    'int32': 'Int32Array',
+    'uint32': 'Uint32Array',
+    'int64': 'BigInt64Array',
+    'uint64': 'BigUint64Array',
+    'float32': 'Float32Array',
+    'float64': 'Float64Array',
+}
+_dtypes = dict((v, k) for k, v in _typed_arrays.items())
+
+
+class BinaryEncoder(object):
+    '''Default hook of json.dumps which collects binary values as blobs.
+
+    bytes, bytearray and memoryview become Buffers (on Python 3).
+    One-dimensional numpy arrays of integers or floats become typed arrays.
+    '''
+    def __init__(self):
+        self.blobs = []
+
+    def default(self, obj):
+        numpy = _numpy()
+        if six.PY3 and isinstance(obj, (bytes, bytearray, memoryview)):
+            js_type = 'Buffer'
+            blob = memoryview(obj)
+            if not blob.c_contiguous:
+                blob = memoryview(blob.tobytes())
+            blob = blob.cast('B')
+        elif numpy is not None and isinstance(obj, numpy.ndarray) and obj.dtype.name in _typed_arrays:
+            if obj.ndim != 1:
+                raise TypeError("Only one-dimensional numpy arrays are serializable, not {0}-dimensional".format(obj.ndim))
+            js_type = _typed_arrays[obj.dtype.name]
+            if not obj.dtype.isnative:
+                obj = obj.astype(obj.dtype.newbyteorder('='))
+            blob = memoryview(numpy.ascontiguousarray(obj).reshape(-1).view(numpy.uint8))
+        else:
+            raise TypeError("Object of type {0} is not JSON serializable".format(type(obj).__name__))
+
+        self.blobs.append(blob)
+        return {BINARY_KEY: len(self.blobs) - 1, 'type': js_type}
+
+
+def decode(value, blobs):
+    '''Replace the placeholders in a decoded JSON value by their blobs.
+
+    Buffers, Uint8Arrays, ArrayBuffers and DataViews become bytes.
+    Other typed arrays become read-only numpy arrays over the blob if numpy is installed,
+    and bytes otherwise.
+    '''
+    if isinstance(value, list):
+        return [decode(v, blobs) for v in value]
+    if isinstance(value, dict):
+        if BINARY_KEY in value:
+            blob = blobs[value[BINARY_KEY]]
+            dtype = _dtypes.get(value.get('type'))
+            numpy = _numpy() if dtype is not None and dtype != 'uint8' else None
+            if numpy is not None:
+                return numpy.frombuffer(blob, dtype=dtype)
+            return blob
+        return dict((k, decode(v, blobs)) for k, v in value.items())
+    return value
+
+
+def _numpy():
+    # imported on first use to keep it out of the import time of execjs
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
@@ -0,0 +1,122 @@
+'''Calibration of runtimes for execjs.get(policy="fastest").
+
+The latencies of each available runtime are measured once by a short probe and
+kept in a JSON file, keyed by the executable and version of the runtime, so that
+later processes reuse them. The file is named by the EXECJS_CALIBRATION_CACHE
+environment variable, or is calibration.json in the execjs directory of the user's
+cache directory. If EXECJS_CALIBRATION_CACHE is empty, results are not persisted.
+'''
+import json
+import os
+import threading
+import time
+
+import execjs._exceptions as exceptions
+
+# workload profile -> measurement it minimizes
+PROFILES = {
+    'startup': 'cold',  # few calls, each in a new context
+    'throughput': 'call',  # many calls on a long-lived context
+}
+
+PROBE_TIMEOUT = 10  # seconds allowed to each evaluation of a probe
+
+_lock = threading.Lock()
+_results = {}  # key -> measurements, or None if the probe failed, for this process
+
+
+def select(runtimes, profile='startup'):
+    '''Return the available runtime of (name, runtime) pairs with the lowest latency for profile.
+
+    Return None if no runtime could be measured.
+    '''
+    if profile not in PROFILES:
+        raise ValueError("unknown workload profile: {0!r}".format(profile))
+    best = None
+    for name, runtime in runtimes:
+        if not runtime.is_available():
+            continue
+        result = calibrate(name, runtime)
+        if result is None:
+            continue
+        latency = result[PROFILES[profile]]
+        if best is None or latency < best[0]:
+            best = (latency, runtime)
+    return best and best[1]
+
+
+def calibrate(name, runtime):
+    '''Return the latencies of runtime, measuring them unless they are cached, or None if the probe failed.
+
+    The latencies are a dictionary of seconds: cold (eval in a new context) and
+    call (eval in a persistent context, or a one-shot one if the runtime has none).
+    A failed probe is not saved, so that later processes probe the runtime again.
+    '''
+    key = json.dumps([name] + runtime._identity())
+    with _lock:
+        if key not in _results:
+            filename = _filename()
+            results = _load(filename)
+            if results.get(key) is None:
+                results[key] = _probe(runtime)
+                if results[key] is not None:
+                    _save(filename, results)
+            _results[key] = results[key]
+        return _results[key]
+
+
+def _probe(runtime, repeat=3):
+    try:
+        cold = _median(runtime.eval, repeat, '1 + 1', timeout=PROBE_TIMEOUT)
+        persistent = getattr(runtime, 'supports_persistent', lambda: False)()
+        with runtime.compile('', persistent=persistent, timeout=PROBE_TIMEOUT) as context:
+            context.eval('1 + 1')  # start a persistent process
+            call = _median(context.eval, repeat * 3, '1 + 1')
+    except (exceptions.Error, OSError):
+        return None
+    return {'cold': cold, 'call': call, 'time': time.time()}
+
+
+def _median(func, repeat, *args, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func(*args, **kwargs)
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def _filename():
+    filename = os.environ.get('EXECJS_CALIBRATION_CACHE')
+    if filename is not None:
+        return filename or None
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'execjs', 'calibration.json')
+
+
+def _load(filename):
+    if filename is None:
+        return {}
+    try:
+        with open(filename) as fp:
+            results = json.load(fp)
+        if isinstance(results, dict):
+            return results
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def _save(filename, results):
+    if filename is None:
+        return
+    temp = '{0}.{1}'.format(filename, os.getpid())
+    try:
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(temp, 'w') as fp:
+            json.dump(results, fp, indent=1, sort_keys=True)
+        getattr(os, 'replace', os.rename)(temp, filename)
+    except (IOError, OSError):
+        pass  # the cache is only an optimization
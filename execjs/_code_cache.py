@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+import os
+import threading
+
+
+class CodeCache(object):
+    '''Directory of compiled code caches for context sources.
+
+    Cache files are named by a hash of the context source and the runtime version,
+    so they can be shared by every process that loads the same source.
+    Use CodeCache.for_directory() to get the instance shared by all users of a directory.
+
+    hits -- Number of loads which used a cache file.
+    misses -- Number of loads which had to compile the source and write a cache file,
+        because there was none or the runtime rejected it.
+    '''
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def for_directory(cls, directory):
+        directory = os.path.abspath(directory)
+        with cls._instances_lock:
+            if directory not in cls._instances:
+                cls._instances[directory] = cls(directory)
+            return cls._instances[directory]
+
+    def path(self, source, version):
+        '''Return the cache file for source compiled by the runtime of the given version.'''
+        import hashlib
+        digest = hashlib.sha256()
+        digest.update(version.encode('utf8') + b'\0')
+        digest.update(source.encode('utf8'))
+        return os.path.join(self.directory, digest.hexdigest() + '.cache')
+
+    @contextmanager
+    def load(self, path):
+        '''Count the load through the cache file at path run in the block as a hit or miss.
+
+        Loaders write the file when the runtime compiled the source, so the load
+        is a hit if the file existed before it and has not been replaced since.
+        '''
+        before = _identity(path)
+        try:
+            yield
+        finally:
+            hit = before is not None and _identity(path) == before
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+
+def _identity(path):
+    # Changes when the file is replaced, or None if there is no file.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime
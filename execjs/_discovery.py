@@ -0,0 +1,79 @@
+'''Optional on-disk cache of runtime executable lookups.
+
+If the EXECJS_DISCOVERY_CACHE environment variable names a file, the results of
+searching PATH for runtime executables are kept in it, so that new processes
+do not need to stat every PATH entry for every runtime.
+The cache is valid while PATH and the modification times of its directories
+are unchanged. A found executable is used only while its own modification
+time is unchanged.
+'''
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+_state = {}  # filename -> entries for the current PATH, loaded once per process
+
+
+def which(command, find):
+    '''Return find(command), using the discovery cache file if one is configured.'''
+    filename = os.environ.get('EXECJS_DISCOVERY_CACHE')
+    if not filename:
+        return find(command)
+
+    key = ' '.join(command)
+    with _lock:
+        entries = _load(filename)
+        entry = entries.get(key)
+        if entry is not None:
+            binary, mtime = entry['binary'], entry['mtime']
+            if binary is None or _mtime(binary[0]) == mtime:
+                return binary
+
+        binary = find(command)
+        entries[key] = {'binary': binary, 'mtime': binary and _mtime(binary[0])}
+        _save(filename, entries)
+        return binary
+
+
+def _path_key():
+    path = os.environ.get('PATH', os.defpath)
+    return {'PATH': path, 'dirs': dict((d, _mtime(d)) for d in path.split(os.pathsep))}
+
+
+def _load(filename):
+    if filename in _state and _state[filename]['key']['PATH'] == os.environ.get('PATH', os.defpath):
+        return _state[filename]['entries']
+
+    key = _path_key()
+    entries = {}
+    try:
+        with open(filename) as fp:
+            data = json.load(fp)
+        if data['key'] == key:
+            entries = data['entries']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    _state[filename] = {'key': key, 'entries': entries}
+    return entries
+
+
+def _save(filename, entries):
+    data = {'key': _state[filename]['key'], 'entries': entries}
+    temp = '{0}.{1}'.format(filename, os.getpid())
+    try:
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(temp, 'w') as fp:
+            json.dump(data, fp)
+        getattr(os, 'replace', os.rename)(temp, filename)
+    except (IOError, OSError):
+        pass  # the cache is only an optimization
+
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
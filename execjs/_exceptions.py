@@ -11,6 +11,10 @@ class RuntimeError(Error):
 # Concrete runtime error classes
 class RuntimeUnavailableError(RuntimeError): pass
 
+# Runtime process was killed for exceeding a time limit.
+# By the way "TimeoutError" shadows the standard exception of Python 3 like RuntimeError does.
+class TimeoutError(RuntimeError): pass
+
 class ProcessExitedWithNonZeroStatus(RuntimeError):
     def __init__(self, status, stdout, stderr):
         RuntimeError.__init__(self, status, stdout, stderr)
@@ -1,39 +1,59 @@
 from subprocess import Popen, PIPE
+import atexit
+from contextlib import contextmanager
+import functools
 import io
+import itertools
 import json
+from json.encoder import encode_basestring_ascii
 import os
 import os.path
 import platform
 import re
+import shutil
 import stat
 import sys
 import tempfile
+import threading
+import time
 import six
+import execjs._discovery as _discovery
+import execjs._instrumentation as _instrumentation
 import execjs._json2 as _json2
+import execjs._limits as _limits
 import execjs._runner_sources as _runner_sources
 
 from execjs._exceptions import (
     ProcessExitedWithNonZeroStatus,
-    ProgramError
+    ProgramError,
+    RuntimeUnavailableError
 )
 
 from execjs._abstract_runtime import AbstractRuntime
 from execjs._abstract_runtime_context import AbstractRuntimeContext
-from execjs._misc import encode_unicode_codepoints
+from execjs._misc import encode_unicode_codepoints, is_identifier_path
+from execjs._code_cache import CodeCache
+from execjs._worker import Worker, MultiplexedWorker
 
 
 class ExternalRuntime(AbstractRuntime):
     '''Runtime to execute codes with external command.'''
-    def __init__(self, name, command, runner_source, encoding='utf8', tempfile=False):
+    def __init__(self, name, command, runner_source, encoding='utf8', tempfile=False, worker_source=None,
+                 code_cache_loader=None, cache_dir=None, fallback_commands=(), context_loader=None):
         self._name = name
         if isinstance(command, str):
             command = [command]
         self._command = command
+        self._fallback_commands = list(fallback_commands)
+        self._context_loader = context_loader
         self._runner_source = runner_source
         self._encoding = encoding
         self._tempfile = tempfile
-
-        self._available = self._binary() is not None
+        self._worker_source = worker_source
+        self._code_cache_loader = code_cache_loader
+        self._code_cache = None
+        if cache_dir is not None and code_cache_loader is not None:
+            self._code_cache = CodeCache.for_directory(cache_dir)
 
     def __str__(self):
         return "{class_name}({runtime_name})".format(
@@ -46,126 +66,794 @@ class ExternalRuntime(AbstractRuntime):
         return self._name
 
     def is_available(self):
-        return self._available
+        return self._binary() is not None
+
+    def supports_persistent(self):
+        '''Return True if contexts of the runtime can be kept in a long-lived process.'''
+        return self._worker_source is not None
+
+    @property
+    def code_cache(self):
+        '''The CodeCache used by contexts compiled without cache_dir, or None.'''
+        return self._code_cache
+
+    def _compile(self, source, cwd=None, persistent=False, cache_dir=None, multiplexed=False, supervisor=None):
+        code_cache = self._code_cache
+        if cache_dir is not None and self._code_cache_loader is not None:
+            code_cache = CodeCache.for_directory(cache_dir)
+
+        if persistent or multiplexed:
+            if not self.supports_persistent():
+                raise RuntimeUnavailableError(
+                    "{name} runtime does not support persistent contexts".format(name=self._name))
+            context_class = self.MultiplexedContext if multiplexed else self.PersistentContext
+            return context_class(self, source, cwd=cwd, code_cache=code_cache, supervisor=supervisor)
+        return self.Context(self, source, cwd=cwd, tempfile=self._tempfile, code_cache=code_cache)
+
+    def _version(self):
+        if not hasattr(self, "_version_cache"):
+            p = Popen(self._binary() + ['--version'], stdout=PIPE, stderr=PIPE, universal_newlines=True)
+            stdoutdata, stderrdata = p.communicate()
+            self._version_cache = stdoutdata.strip()
+        return self._version_cache
+
+    def _identity(self):
+        binary = self._binary()
+        if self._worker_source is not None:
+            version = self._version()
+        else:
+            # runtimes which may not understand --version are identified by their executable file
+            try:
+                st = os.stat(binary[0])
+                version = 'mtime={0} size={1}'.format(st.st_mtime, st.st_size)
+            except OSError:
+                version = ''
+        return [' '.join(binary), version]
 
-    def _compile(self, source, cwd=None):
-        return self.Context(self, source, cwd=cwd, tempfile=self._tempfile)
+    def _runner_template(self):
+        if not hasattr(self, "_runner_template_cache"):
+            self._runner_template_cache = _RunnerTemplate(self._runner_source)
+        return self._runner_template_cache
 
     def _binary(self):
+        # searched on first use, so that importing execjs does not search PATH
         if not hasattr(self, "_binary_cache"):
-            self._binary_cache = _which(self._command)
+            binary = None
+            for command in [self._command] + self._fallback_commands:
+                binary = _discovery.which(command, _which)
+                if binary is not None:
+                    break
+            self._binary_cache = binary
         return self._binary_cache
 
     class Context(AbstractRuntimeContext):
         # protected
 
-        def __init__(self, runtime, source='', cwd=None, tempfile=False):
+        def __init__(self, runtime, source='', cwd=None, tempfile=False, code_cache=None):
             self._runtime = runtime
             self._source = source
             self._cwd = cwd
             self._tempfile = tempfile
+            self._code_cache = code_cache
+            self._code_cache_path = None
+            if code_cache is not None:
+                self._code_cache_path = code_cache.path(source, runtime._version())
+
+        @property
+        def code_cache(self):
+            '''The CodeCache of the context source, or None.'''
+            return self._code_cache
+
+        @property
+        def _runtime_name(self):
+            return self._runtime.name
 
         def is_available(self):
             return self._runtime.is_available()
 
         def _eval(self, source):
-            if not source.strip():
-                data = "''"
-            else:
-                data = "'('+" + json.dumps(source, ensure_ascii=True) + "+')'"
+            return self.exec_(self._eval_source(source))
 
-            code = 'return eval({data})'.format(data=data)
-            return self.exec_(code)
+        def _eval_async(self, source):
+            return self._exec_async(self._eval_source(source))
 
-        def _exec_(self, source):
-            if self._source:
-                source = self._source + '\n' + source
+        def _derive(self, source):
+            # one-shot contexts send their whole source on every call anyway
+            return ExternalRuntime.Context(
+                self._runtime, self._source + '\n' + source, cwd=self._cwd,
+                tempfile=self._tempfile, code_cache=self._code_cache,
+            )
 
-            if self._tempfile:
-                output = self._exec_with_tempfile(source)
-            else:
-                output = self._exec_with_pipe(source)
+        def _exec_(self, source):
+            with self._code_cache_load():
+                if self._tempfile:
+                    output = self._exec_with_tempfile(source)
+                else:
+                    output = self._exec_with_pipe(source)
             return self._extract_result(output)
 
+        def _exec_async(self, source):
+            import execjs._async as _async
+            return _async.exec_context(self, self._active_limits(), source)
+
         def _call(self, identifier, *args):
+            try:
+                source = self._call_source(identifier, args)
+            except TypeError:
+                if not self._runtime.supports_persistent():
+                    raise
+                # binary arguments need the protocol of the worker
+                return self._call_once(identifier, args)
+            return self.exec_(source)
+
+        def _call_once(self, identifier, args):
+            limits = self._active_limits()
+            return self._call_by(self._new_worker(limits.popen_options()), limits, identifier, args)
+
+        def _call_by(self, worker, limits, identifier, args):
+            # Serve one call by a new worker, and close it.
+            try:
+                status, value = self._request(worker, limits, 'call', name=identifier, args=args)
+            finally:
+                worker.close()
+            return self._result(status, value)
+
+        def _call_each(self, identifier, args_list):
+            if not self._runtime.supports_persistent():
+                return AbstractRuntimeContext._call_each(self, identifier, args_list)
+            # binary arguments need the protocol of the worker; one serves the whole batch
+            limits = self._active_limits()
+            worker = self._new_worker(limits.popen_options())
+            results = []
+            try:
+                for args in args_list:
+                    status, value = self._request(worker, limits, 'call', name=identifier, args=args)
+                    results.append(value if status == 'ok' else ProgramError(value))
+            finally:
+                worker.close()
+            return results
+
+        def _request(self, worker, limits, op, **fields):
+            with _limits.Watchdog(limits.timeout, worker.kill) as watchdog:
+                try:
+                    return worker.request(op, **fields)
+                except ProcessExitedWithNonZeroStatus as e:
+                    limits.check(e.status, watchdog.expired)
+                    raise
+
+        def _call_async(self, identifier, *args):
+            try:
+                source = self._call_source(identifier, args)
+            except TypeError:
+                if not self._runtime.supports_persistent():
+                    raise
+                # binary arguments need the protocol of the worker, which is served in the executor
+                import execjs._async as _async
+                limits = self._active_limits()
+                worker = self._new_worker(limits.popen_options())
+                return _async.run_in_executor_or_kill(worker, self._call_by, worker, limits, identifier, args)
+            return self._exec_async(source)
+
+        def _call_iter(self, identifier, *args):
+            if not self._runtime.supports_persistent():
+                return AbstractRuntimeContext._call_iter(self, identifier, *args)
+            return self._call_iter_once(identifier, args)
+
+        def _call_iter_once(self, identifier, args):
+            worker = self._new_worker(self._active_limits().popen_options())
+            try:
+                for item in self._iter_worker(worker, identifier, args):
+                    yield item
+            finally:
+                worker.close()
+
+        def _iter_worker(self, worker, identifier, args, **fields):
+            # The worker is killed if the iteration stops early,
+            # because the rest of the items cannot be skipped.
+            finished = False
+            try:
+                for status, value in worker.request_iter('iter', name=identifier, args=args, **fields):
+                    if status == 'item':
+                        yield value
+                    else:
+                        finished = True
+                        self._result(status, value)
+            finally:
+                if not finished:
+                    worker.kill()
+
+        def _new_worker(self, popen_options=None, worker_class=Worker, supervisor=None):
+            return worker_class(
+                self._runtime._binary() + ['-e', self._runtime._worker_source], self._source, cwd=self._cwd,
+                code_cache=self._code_cache, code_cache_path=self._code_cache_path, popen_options=popen_options,
+                supervisor=supervisor,
+            )
+
+        def _active_limits(self):
+            return _limits.current() or self._default_limits
+
+        def _eval_source(self, source):
+            if not source.strip():
+                data = "''"
+            else:
+                data = "'('+" + json.dumps(source, ensure_ascii=True) + "+')'"
+
+            return 'return eval({data})'.format(data=data)
+
+        def _call_source(self, identifier, args):
             args = json.dumps(args)
-            return self._eval("{identifier}.apply(this, {args})".format(identifier=identifier, args=args))
+            if is_identifier_path(identifier):
+                # The arguments are a JSON literal in the program, so they are
+                # encoded and parsed only once.
+                return 'return ' + identifier + '.apply(this, ' + args + ')'
+            return self._eval_source("{identifier}.apply(this, {args})".format(identifier=identifier, args=args))
 
         def _exec_with_pipe(self, source):
             cmd = self._runtime._binary()
+            limits = self._active_limits()
+            with _instrumentation.phase('compile'):
+                chunks = self._compile(source)
 
             p = None
             try:
-                p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=self._cwd, universal_newlines=True)
-                input = self._compile(source)
-                if six.PY2:
-                    input = input.encode(sys.getfilesystemencoding())
-                stdoutdata, stderrdata = p.communicate(input=input)
-                ret = p.wait()
+                with _instrumentation.phase('spawn'):
+                    p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=self._cwd, universal_newlines=True,
+                              **limits.popen_options())
+                with _limits.Watchdog(limits.timeout, functools.partial(_limits.kill, p)) as watchdog, \
+                        _instrumentation.phase('first_byte'):
+                    # The runtime reads the whole program before it writes anything,
+                    # so the chunks can be written before communicate() reads the output.
+                    try:
+                        for chunk in chunks:
+                            if six.PY2:
+                                chunk = chunk.encode(sys.getfilesystemencoding())
+                            p.stdin.write(chunk)
+                    except (IOError, OSError):
+                        pass  # the runtime exited early; its status is checked below
+                    stdoutdata, stderrdata = p.communicate()
+                    ret = p.wait()
             finally:
                 del p
 
+            _instrumentation.record(status=ret, output_bytes=len(stdoutdata))
+            limits.check(ret, watchdog.expired)
             self._fail_on_non_zero_status(ret, stdoutdata, stderrdata)
             return stdoutdata
 
         def _exec_with_tempfile(self, source):
-            (fd, filename) = tempfile.mkstemp(prefix='execjs', suffix='.js')
-            os.close(fd)
+            with _instrumentation.phase('compile'):
+                filename = self._write_tempfile(source)
             try:
-                with io.open(filename, "w+", encoding=self._runtime._encoding) as fp:
-                    fp.write(self._compile(source))
                 cmd = self._runtime._binary() + [filename]
+                limits = self._active_limits()
 
                 p = None
                 try:
-                    p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=self._cwd, universal_newlines=True)
-                    stdoutdata, stderrdata = p.communicate()
-                    ret = p.wait()
+                    with _instrumentation.phase('spawn'):
+                        p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=self._cwd, universal_newlines=True,
+                                  **limits.popen_options())
+                    with _limits.Watchdog(limits.timeout, functools.partial(_limits.kill, p)) as watchdog, \
+                            _instrumentation.phase('first_byte'):
+                        stdoutdata, stderrdata = p.communicate()
+                        ret = p.wait()
                 finally:
                     del p
 
+                _instrumentation.record(status=ret, output_bytes=len(stdoutdata))
+                limits.check(ret, watchdog.expired)
                 self._fail_on_non_zero_status(ret, stdoutdata, stderrdata)
                 return stdoutdata
             finally:
                 os.remove(filename)
 
+        def _write_tempfile(self, source):
+            if self._uses_context_file():
+                chunks = self._compile_with_context_file(source)
+            else:
+                chunks = self._compile(source)
+
+            (fd, filename) = tempfile.mkstemp(prefix='execjs', suffix='.js', dir=_tempfile_dir())
+            os.close(fd)
+            try:
+                with io.open(filename, "w+", encoding=self._runtime._encoding) as fp:
+                    fp.writelines(chunks)
+            except:
+                os.remove(filename)
+                raise
+            return filename
+
+        def _uses_context_file(self):
+            return self._tempfile and bool(self._source) and self._runtime._context_loader is not None
+
+        @contextmanager
+        def _code_cache_load(self):
+            # Count the load of the context by the program run in the block,
+            # if it loads the context through the code cache (see _context_source).
+            if self._code_cache is None or self._uses_context_file():
+                yield
+            else:
+                with self._code_cache.load(self._code_cache_path):
+                    yield
+
+        def _compile_with_context_file(self, source):
+            # The runner loads the context from a file written once per context source,
+            # and evaluates only the program of this call in the scope of the context.
+            program = "return {context}({expression}).call(this)".format(
+                context=_CONTEXT_FUNCTION,
+                expression=json.dumps("(function() {" + source + "\n})"),
+            )
+            loader = self._runtime._context_loader.format(path=json.dumps(self._context_file()))
+            return [loader, '\n'] + self._runtime._runner_template().render('', program)
+
+        def _context_file(self):
+            if not hasattr(self, "_context_file_cache"):
+                template = self._runtime._runner_template()
+                source = self._encoded_source() if template.encoded else self._source
+                import hashlib
+                digest = hashlib.sha256()
+                digest.update(self._runtime._encoding.encode('ascii') + b'\0')
+                digest.update(source.encode('utf8'))
+                self._context_file_cache = os.path.join(_tempfile_dir(), 'execjs-context-' + digest.hexdigest() + '.js')
+                self._context_file_source = source
+                self._context_file_used = 0
+
+            filename = self._context_file_cache
+            if not os.path.exists(filename):
+                temp = '{0}.{1}.{2}'.format(filename, os.getpid(), threading.current_thread().ident)
+                with io.open(temp, "w", encoding=self._runtime._encoding) as fp:
+                    fp.writelines([
+                        'var ', _CONTEXT_FUNCTION, ' = function(', _CONTEXT_EXPRESSION, ') {\n',
+                        self._context_file_source,
+                        '\n;return eval(', _CONTEXT_EXPRESSION, ');\n};\n',
+                    ])
+                _replace(temp, filename)
+                self._context_file_used = time.time()
+                _prune_context_files(os.path.dirname(filename), filename)
+            elif time.time() - self._context_file_used >= _CONTEXT_FILE_TOUCH_INTERVAL:
+                # record the use, so that other processes do not prune the file
+                self._context_file_used = time.time()
+                _touch(filename)
+            return filename
+
         def _fail_on_non_zero_status(self, status, stdoutdata, stderrdata):
             if status != 0:
                 raise ProcessExitedWithNonZeroStatus(status=status, stdout=stdoutdata, stderr=stderrdata)
 
         def _compile(self, source):
-            runner_source = self._runtime._runner_source
-
-            replacements = {
-                '#{source}': lambda: source,
-                '#{encoded_source}': lambda: json.dumps(
-                    "(function(){ " +
-                    encode_unicode_codepoints(source) +
-                    " })()"
-                ),
-                '#{json2_source}': _json2._json2_source,
-            }
-
-            pattern = "|".join(re.escape(k) for k in replacements)
-
-            runner_source = re.sub(pattern, lambda m: replacements[m.group(0)](), runner_source)
-
-            return runner_source
+            '''Return the runner program for source as a list of string chunks.'''
+            template = self._runtime._runner_template()
+            escaped_source = None
+            if template.encoded and self._code_cache is None:
+                escaped_source = self._escaped_source()
+            return template.render(self._context_source(), source, escaped_source)
+
+        # The context source as placed by runners with #{encoded_source},
+        # computed once per context, when it is first needed.
+        def _encoded_source(self):
+            if not hasattr(self, "_encoded_source_cache"):
+                self._encoded_source_cache = encode_unicode_codepoints(self._source)
+            return self._encoded_source_cache
+
+        def _escaped_source(self):
+            if not hasattr(self, "_escaped_source_cache"):
+                self._escaped_source_cache = _json_escape(self._encoded_source())
+            return self._escaped_source_cache
+
+        def _context_source(self):
+            if self._code_cache is None:
+                return self._source
+
+            # a program which loads the source through the code cache
+            if not hasattr(self, "_loader_cache"):
+                self._loader_cache = "({loader})({source}, {path});".format(
+                    loader=self._runtime._code_cache_loader,
+                    source=json.dumps(self._source),
+                    path=json.dumps(self._code_cache_path),
+                )
+            return self._loader_cache
 
         def _extract_result(self, output):
-            output = output.replace("\r\n", "\n").replace("\r", "\n")
-            output_last_line = output.split("\n")[-2]
+            with _instrumentation.phase('decode'):
+                output = output.replace("\r\n", "\n").replace("\r", "\n")
+                output_last_line = output.split("\n")[-2]
 
-            ret = json.loads(output_last_line)
+                ret = json.loads(output_last_line)
             if len(ret) == 1:
                 ret = [ret[0], None]
+            elif len(ret) == 3:
+                # the runner reports the milliseconds the program ran
+                _instrumentation.record(execute=ret.pop() / 1000.0)
             status, value = ret
+            return self._result(status, value)
 
+        def _result(self, status, value):
             if status == "ok":
                 return value
             else:
                 raise ProgramError(value)
 
+    class PersistentContext(Context):
+        '''Context whose source is loaded once into a long-lived runtime process.
+
+        Every exec_, eval and call is served by the same process.
+        call_iter runs in a process of its own, loaded with the source only,
+        so that an open stream does not block other calls.
+        It is started on first use and restarted automatically if it dies,
+        or is killed for exceeding a limit. A Supervisor can start it in advance,
+        check it and replace it (see Supervisor).
+        Call close() (or use the context as a context manager) to terminate it.
+        The coroutines of exec_async, eval_async and call_async each hold a thread
+        of the default executor until their response; MultiplexedContext needs none.
+        '''
+        _worker_class = Worker
+
+        def __init__(self, runtime, source='', cwd=None, code_cache=None, supervisor=None):
+            ExternalRuntime.Context.__init__(self, runtime, source, cwd=cwd, code_cache=code_cache)
+            self._supervisor = supervisor
+            self._lock = threading.Lock()
+            self._worker = self._new_worker(self._worker_popen_options, self._worker_class, supervisor)
+
+        def _worker_popen_options(self):
+            # The process outlives calls, so only the memory limit applies to it,
+            # and time limits are enforced per request by the watchdog.
+            return _limits.Limits(max_memory=self._default_limits.max_memory).popen_options(new_session=True)
+
+        def _request_limits(self):
+            limits = self._active_limits()
+            timeouts = [t for t in (limits.timeout, limits.max_cpu_seconds) if t is not None]
+            return _limits.Limits(timeout=min(timeouts) if timeouts else None)
+
+        def start(self):
+            '''Start the runtime process now instead of on first use.'''
+            with self._lock:
+                status, value = self._worker.start()
+            self._result(status, value)
+
+        def close(self):
+            with self._lock:
+                self._worker.close()
+
+        def _serve(self, op, **fields):
+            with self._lock:
+                return self._request(self._worker, self._request_limits(), op, **fields)
+
+        def _exec_(self, source):
+            status, value = self._serve('exec', code=source)
+            return self._result(status, value)
+
+        def _exec_async(self, source):
+            import execjs._async as _async
+            return _async.run_in_executor_or_kill(self._worker, _limits.bound(self._exec_), source)
+
+        def _call(self, identifier, *args):
+            # the arguments are sent as data and decoded by JSON.parse
+            status, value = self._serve('call', name=identifier, args=args)
+            return self._result(status, value)
+
+        def _call_async(self, identifier, *args):
+            import execjs._async as _async
+            return _async.run_in_executor_or_kill(self._worker, _limits.bound(self._call), identifier, *args)
+
+        def _call_each(self, identifier, args_list):
+            return AbstractRuntimeContext._call_each(self, identifier, args_list)
+
+        def _call_iter(self, identifier, *args):
+            # A stream may stay open for long, so it does not hold the process of the context.
+            return self._call_iter_once(identifier, args)
+
+        def _derive(self, source):
+            return ExternalRuntime.DerivedContext(self, source)
+
+        def _replicate(self):
+            # a process of its own
+            context = type(self)(
+                self._runtime, self._source, cwd=self._cwd, code_cache=self._code_cache, supervisor=self._supervisor)
+            context._default_limits = self._default_limits
+            context._prewarm()
+            return context
+
+        def _prewarm(self):
+            if self._supervisor is not None and self._supervisor.prewarm:
+                self._worker.prewarm()
+
+        _function_keys = itertools.count(1)
+
+        def _bind(self, identifier):
+            # The process keeps the function by key, and invoking it sends only the key and the arguments.
+            key = next(self._function_keys)
+            arity = self._result(*self._serve('bind', key=key, name=identifier))
+
+            def invoke(args):
+                while True:
+                    status, value = self._serve('invoke', key=key, args=args)
+                    if status != 'nofunction':
+                        return self._result(status, value)
+                    # a new process; look the function up in it first
+                    self._result(*self._serve('bind', key=key, name=identifier))
+            return invoke, arity
+
+    class MultiplexedContext(PersistentContext):
+        '''Persistent context which many threads can call at the same time.
+
+        Calls are not serialized: each is sent to the runtime process as soon as it is made,
+        tagged with an id, and its response is routed back to the calling thread.
+        JavaScript runs one request at a time, but a function returning a Promise lets
+        the process serve other requests until the Promise settles, so the I/O waits
+        of many calls overlap.
+
+        Thread safety: exec_, eval, call, start and close may be called from any number
+        of threads at once, and every call returns its own result. Calls made by one thread
+        run in the order they are made. A call exceeding its timeout kills the process,
+        which fails the other calls in flight; the next call starts a new process.
+        The coroutines of exec_async, eval_async and call_async wait for their responses
+        without a thread each, and cancelling one abandons only its own request.
+        '''
+        _worker_class = MultiplexedWorker
+
+        def start(self):
+            '''Start the runtime process now instead of on first use.'''
+            status, value = self._worker.start()
+            self._result(status, value)
+
+        def close(self):
+            self._worker.close()
+
+        def _serve(self, op, **fields):
+            return self._request(self._worker, self._request_limits(), op, **fields)
+
+        def _exec_async(self, source):
+            import execjs._async as _async
+            return _async.serve_multiplexed(self, self._request_limits(), 'exec', code=source)
+
+        def _call_async(self, identifier, *args):
+            import execjs._async as _async
+            return _async.serve_multiplexed(self, self._request_limits(), 'call', name=identifier, args=args)
+
+    class DerivedContext(PersistentContext):
+        '''Context whose source runs in a scope of its own in the process of a persistent context.
+
+        The process and the source loaded into it are those of the base context,
+        so deriving a context only sends and runs its own source, once per process.
+        Its declarations are local to its scope, while assignments to globals are
+        seen by the base context and its other derived contexts.
+        Calls follow the locking of the base context (see MultiplexedContext).
+        Closing a derived context removes its scope; closing the base context
+        terminates the process of all of them. call_iter streams items from a process
+        of its own, loaded with the source of the base context, in which the scope is created.
+        '''
+        _scope_keys = itertools.count(1)
+        _owns_base = False  # whether closing the context closes the base context
+
+        def __init__(self, base, source):
+            ExternalRuntime.Context.__init__(self, base._runtime, source, cwd=base._cwd)
+            self._base = base
+            self._supervisor = base._supervisor
+            self._worker = base._worker
+            self._scope = next(self._scope_keys)
+
+        def start(self):
+            '''Start the runtime process and run the source now instead of on first use.'''
+            self._result(*self._base._serve('scope', key=self._scope, code=self._source))
+
+        def close(self):
+            if self._owns_base:
+                self._base.close()
+            elif self._worker.alive:
+                self._base._serve('drop', key=self._scope)
+
+        def _replicate(self):
+            context = self._base._replicate().derive(self._source)
+            context._owns_base = True
+            return context
+
+        def _serve(self, op, **fields):
+            while True:
+                status, value = self._base._serve(op, scope=self._scope, **fields)
+                if status != 'noscope':
+                    return status, value
+                # a new process; run the source in it first
+                status, value = self._base._serve('scope', key=self._scope, code=self._source)
+                if status != 'ok':
+                    return status, value
+
+        def _call_iter_once(self, identifier, args):
+            worker = self._base._new_worker(self._active_limits().popen_options())
+            try:
+                self._result(*worker.request('scope', key=self._scope, code=self._source))
+                for item in self._iter_worker(worker, identifier, args, scope=self._scope):
+                    yield item
+            finally:
+                worker.close()
+
+        def _derive(self, source):
+            return self._base.derive(self._source + '\n' + source)
+
+
+_CONTEXT_FUNCTION = '__execjs_context'
+_CONTEXT_EXPRESSION = '__execjs_expression'
+
+
+# Context files are shared by the processes of a user. When one is written, those which
+# have not been used for CONTEXT_FILE_MAX_AGE seconds are removed, and then the least
+# recently used ones until all take at most CONTEXT_FILES_MAX_BYTES.
+CONTEXT_FILE_MAX_AGE = 3600
+CONTEXT_FILES_MAX_BYTES = 256 * 1024 * 1024
+
+# A context records its use of its file this often, by its access time;
+# files used within twice this time may be in use and are never removed.
+_CONTEXT_FILE_TOUCH_INTERVAL = 60
+
+
+def _tempfile_dir():
+    """protected
+
+    Directory for runner files; in memory (/dev/shm) where available.
+
+    The directory is shared by the processes of the user. If it exists but may be
+    written by someone else, a private directory removed at exit is used instead.
+    """
+    global _tempfile_dir_cache
+    if _tempfile_dir_cache is None:
+        base = tempfile.gettempdir()
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            base = '/dev/shm'
+        user = str(os.getuid()) if hasattr(os, 'getuid') else ''
+        directory = os.path.join(base, 'execjs-' + user)
+        try:
+            os.mkdir(directory, 0o700)
+        except OSError:
+            if not _is_private_directory(directory):
+                directory = tempfile.mkdtemp(prefix='execjs-')
+                atexit.register(shutil.rmtree, directory, True)
+        _tempfile_dir_cache = directory
+    return _tempfile_dir_cache
+
+_tempfile_dir_cache = None
+
+
+def _is_private_directory(path):
+    """protected
+
+    Return whether path is a directory, not a symbolic link, which only the user can access.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if not hasattr(os, 'getuid'):
+        return True  # Windows: the temporary directory is private to the user
+    return st.st_uid == os.getuid() and st.st_mode & 0o077 == 0
+
+
+def _touch(filename):
+    """protected
+
+    Set the access time of a file to now, keeping its modification time.
+    """
+    try:
+        os.utime(filename, (time.time(), os.stat(filename).st_mtime))
+    except OSError:
+        pass
+
+
+def _prune_context_files(directory, keep):
+    """protected
+
+    Remove the unused context files of directory (see CONTEXT_FILE_MAX_AGE), except keep.
+    """
+    now = time.time()
+    files = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith('execjs-context-') and name.endswith('.js'):
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            files.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+
+    files.sort()  # least recently used first
+    total = sum(size for _, size, _ in files)
+    for used, size, path in files:
+        if path == keep or now - used < 2 * _CONTEXT_FILE_TOUCH_INTERVAL:
+            continue
+        if now - used < CONTEXT_FILE_MAX_AGE and total <= CONTEXT_FILES_MAX_BYTES:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _replace(src, dst):
+    """protected"""
+    try:
+        getattr(os, 'replace', os.rename)(src, dst)
+    except OSError:
+        # another process has written the same file (rename fails on Windows)
+        os.remove(src)
+        if not os.path.exists(dst):
+            raise
+
+
+class _RunnerTemplate(object):
+    '''protected
+
+    Runner source parsed once into literal segments and placeholders.
+    Rendering only lists the chunks of the program, without copying the sources.
+    '''
+    _placeholder = re.compile(r'#\{(source|encoded_source|json2_source)\}')
+
+    def __init__(self, runner_source):
+        self.encoded = '#{encoded_source}' in runner_source
+        self._segments = []
+        literal = ''
+        pos = 0
+        for m in self._placeholder.finditer(runner_source):
+            literal += runner_source[pos:m.start()]
+            pos = m.end()
+            name = m.group(1)
+            if name == 'json2_source':
+                literal += _json2._json2_source()
+            elif name == 'encoded_source':
+                # the escaped form of the fixed parts of "(function(){ " + source + " })()"
+                self._segments.append(literal + '"(function(){ ')
+                self._segments.append(self._render_encoded_source)
+                literal = ' })()"'
+            else:
+                self._segments.append(literal)
+                self._segments.append(self._render_source)
+                literal = ''
+        self._segments.append(literal + runner_source[pos:])
+
+    def render(self, context_source, source, escaped_context_source=None):
+        '''Return the chunks of the program.
+
+        escaped_context_source -- escape(context_source), if the caller has it already.
+        '''
+        chunks = []
+        for segment in self._segments:
+            if callable(segment):
+                segment(chunks, context_source, source, escaped_context_source)
+            else:
+                chunks.append(segment)
+        return chunks
+
+    @staticmethod
+    def escape(source):
+        '''Return source as it is placed in #{encoded_source}.'''
+        return _json_escape(encode_unicode_codepoints(source))
+
+    @staticmethod
+    def _render_source(chunks, context_source, source, escaped_context_source):
+        if context_source:
+            chunks.append(context_source)
+            chunks.append('\n')
+        chunks.append(source)
+
+    @classmethod
+    def _render_encoded_source(cls, chunks, context_source, source, escaped_context_source):
+        # JSON escaping works character by character, so the parts
+        # of a JSON string can be escaped separately.
+        if context_source:
+            if escaped_context_source is None:
+                escaped_context_source = cls.escape(context_source)
+            chunks.append(escaped_context_source)
+            chunks.append('\\n')
+        chunks.append(cls.escape(source))
+
+
+def _json_escape(s):
+    '''protected'''
+    return encode_basestring_ascii(s)[1:-1]
+
 
 def _is_windows():
     """protected"""
@@ -181,7 +869,7 @@ def _decode_if_not_text(s):
 
 def _find_executable(prog, pathext=("",)):
     """protected"""
-    pathlist = _decode_if_not_text(os.environ.get('PATH', '')).split(os.pathsep)
+    pathlist = _decode_if_not_text(os.environ.get('PATH', os.defpath)).split(os.pathsep)
 
     for dir in pathlist:
         for ext in pathext:
@@ -215,10 +903,15 @@ def _which(command):
 
 
 def node():
-    r = node_node()
-    if r.is_available():
-        return r
-    return node_nodejs()
+    return ExternalRuntime(
+        name="Node.js (V8)",
+        command=['node'],
+        fallback_commands=[['nodejs']],
+        encoding='UTF-8',
+        runner_source=_runner_sources.Node,
+        worker_source=_runner_sources.NodeWorker,
+        code_cache_loader=_runner_sources.NodeLoadContext
+    )
 
 
 def node_node():
@@ -226,7 +919,9 @@ def node_node():
         name="Node.js (V8)",
         command=['node'],
         encoding='UTF-8',
-        runner_source=_runner_sources.Node
+        runner_source=_runner_sources.Node,
+        worker_source=_runner_sources.NodeWorker,
+        code_cache_loader=_runner_sources.NodeLoadContext
     )
 
 
@@ -235,7 +930,9 @@ def node_nodejs():
         name="Node.js (V8)",
         command=['nodejs'],
         encoding='UTF-8',
-        runner_source=_runner_sources.Node
+        runner_source=_runner_sources.Node,
+        worker_source=_runner_sources.NodeWorker,
+        code_cache_loader=_runner_sources.NodeLoadContext
     )
 
 
@@ -244,7 +941,8 @@ def jsc():
         name="JavaScriptCore",
         command=["/System/Library/Frameworks/JavaScriptCore.framework/Versions/A/Resources/jsc"],
         runner_source=_runner_sources.JavaScriptCore,
-        tempfile=True
+        tempfile=True,
+        context_loader='load({path});'
     )
 
 
@@ -253,7 +951,8 @@ def spidermonkey():
         name="SpiderMonkey",
         command=["js"],
         runner_source=_runner_sources.SpiderMonkey,
-        tempfile=True
+        tempfile=True,
+        context_loader='load({path});'
     )
 
 
@@ -263,7 +962,8 @@ def jscript():
         command=["cscript", "//E:jscript", "//Nologo"],
         encoding="ascii",
         runner_source=_runner_sources.JScript,
-        tempfile=True
+        tempfile=True,
+        context_loader='eval(new ActiveXObject("Scripting.FileSystemObject").OpenTextFile({path}, 1).ReadAll());'
     )
 
 
@@ -272,7 +972,8 @@ def phantomjs():
         name="PhantomJS",
         command=["phantomjs"],
         runner_source=_runner_sources.PhantomJS,
-        tempfile=True
+        tempfile=True,
+        context_loader='phantom.injectJs({path});'
     )
 
 
@@ -281,7 +982,8 @@ def slimerjs():
         name="SlimerJS",
         command=["slimerjs"],
         runner_source=_runner_sources.SlimerJS,
-        tempfile=True
+        tempfile=True,
+        context_loader='phantom.injectJs({path});'
     )
 
 
@@ -290,5 +992,6 @@ def nashorn():
         name="Nashorn",
         command=["jjs"],
         runner_source=_runner_sources.Nashorn,
-        tempfile=True
+        tempfile=True,
+        context_loader='load({path});'
     )
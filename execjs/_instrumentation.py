@@ -0,0 +1,198 @@
+'''Measurements of calls for listeners registered with execjs.add_listener.
+
+Each exec_, eval and call of a context is measured as a CallEvent, whose phases
+are recorded by the layers involved in serving it. Nothing is measured while
+no listener is registered.
+'''
+from contextlib import contextmanager
+import threading
+import time
+
+_listeners = []
+_local = threading.local()
+
+
+class CallEvent(object):
+    '''Measurements of one exec_, eval or call, passed to listeners after it has finished.
+
+    runtime -- Name of the runtime.
+    op -- 'exec', 'eval' or 'call'.
+    name -- Name of the called function, or None.
+    seconds -- Total wall time of the call.
+    phases -- Dictionary of seconds spent in each phase of the call that happened:
+        'compile' (building the runner program), 'spawn' (starting the runtime process),
+        'load' (loading the context source into a persistent process),
+        'first_byte' (from sending the program until the output of the runtime has arrived),
+        'execute' (running the JavaScript, as measured by the runtime itself),
+        'decode' (parsing the result).
+    output_bytes -- Size of the output of the runtime, or None.
+    status -- Exit status of the runtime process, or None if the process was not waited for.
+    error -- Exception raised by the call, or None.
+    '''
+    def __init__(self, runtime, op, name):
+        self.runtime = runtime
+        self.op = op
+        self.name = name
+        self.seconds = None
+        self.phases = {}
+        self.output_bytes = None
+        self.status = None
+        self.error = None
+
+    def __repr__(self):
+        return "CallEvent(runtime={0!r}, op={1!r}, name={2!r}, seconds={3!r})".format(
+            self.runtime, self.op, self.name, self.seconds)
+
+
+def add_listener(listener):
+    '''Call listener(event) with a CallEvent after every exec_, eval and call of any context.
+
+    The coroutines of exec_async, eval_async and call_async are measured too, without phases.
+    '''
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    '''Stop calling a listener added with add_listener.'''
+    _listeners.remove(listener)
+
+
+def current():
+    '''Return the CallEvent of the call running in this thread, or None.'''
+    return getattr(_local, 'event', None)
+
+
+@contextmanager
+def measured(runtime, op, name=None):
+    '''Measure the calls in the block as one CallEvent and pass it to the listeners.
+
+    Nested blocks belong to the event of the outermost one.
+    '''
+    if not _listeners or current() is not None:
+        yield
+        return
+
+    event = _local.event = CallEvent(runtime, op, name)
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        event.error = e
+        raise
+    finally:
+        event.seconds = time.time() - start
+        _local.event = None
+        notify(event)
+
+
+def notify(event):
+    '''Pass a finished CallEvent to the listeners.
+
+    An exception raised by a listener is logged to the 'execjs' logger, and
+    neither replaces the result or the exception of the call nor stops the other listeners.
+    '''
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            import logging
+            logging.getLogger('execjs').exception("listener %r failed on %r", listener, event)
+
+
+@contextmanager
+def phase(name):
+    '''Add the time spent in the block to a phase of the current event, if any.'''
+    event = current()
+    if event is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        event.phases[name] = event.phases.get(name, 0.0) + time.time() - start
+
+
+def record(**fields):
+    '''Set fields of the current event, if any. Phases are given as keyword arguments too.'''
+    event = current()
+    if event is None:
+        return
+    for key, value in fields.items():
+        if hasattr(event, key):
+            setattr(event, key, value)
+        else:
+            event.phases[key] = value
+
+
+class Stats(object):
+    '''Listener which aggregates the events of calls per runtime, op and function name.
+
+    >>> stats = execjs.Stats()
+    >>> execjs.add_listener(stats)
+
+    buckets -- Upper bounds in seconds of the buckets of the latency histograms.
+    '''
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        key = (event.runtime, event.op, event.name)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'count': 0,
+                    'errors': 0,
+                    'seconds': 0.0,
+                    'output_bytes': 0,
+                    'phases': {},
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            series['count'] += 1
+            series['errors'] += event.error is not None
+            series['seconds'] += event.seconds
+            series['output_bytes'] += event.output_bytes or 0
+            for name, seconds in event.phases.items():
+                series['phases'][name] = series['phases'].get(name, 0.0) + seconds
+            series['histogram'][self._bucket(event.seconds)] += 1
+
+    def snapshot(self):
+        '''Return the aggregates as a list of JSON-serializable dictionaries, one per runtime, op and name.
+
+        Each has the keys runtime, op, name, count, errors, seconds (total), output_bytes (total),
+        phases (total seconds per phase) and histogram (a list of [upper bound, count] pairs,
+        where the last upper bound is None for the overflow bucket; counts are not cumulative).
+        '''
+        bounds = list(self.buckets) + [None]
+        with self._lock:
+            return [
+                dict(
+                    runtime=runtime, op=op, name=name,
+                    count=series['count'],
+                    errors=series['errors'],
+                    seconds=series['seconds'],
+                    output_bytes=series['output_bytes'],
+                    phases=dict(series['phases']),
+                    histogram=[list(pair) for pair in zip(bounds, series['histogram'])],
+                )
+                for (runtime, op, name), series in sorted(self._series.items(), key=_sort_key)
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _bucket(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                return i
+        return len(self.buckets)
+
+
+def _sort_key(item):
+    return tuple('' if k is None else k for k in item[0])
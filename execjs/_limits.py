@@ -0,0 +1,186 @@
+'''Time and resource limits of runtime processes.
+
+Resource limits are set with setrlimit in the runtime process before it starts,
+so they are only enforced on POSIX systems. Timeouts are enforced everywhere by
+a watchdog thread which kills the process (and its process group, if it leads one).
+'''
+from contextlib import contextmanager
+import math
+import os
+import signal
+import threading
+
+import six
+
+from execjs._exceptions import TimeoutError
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if resource is not None:
+    # Runtimes such as Node.js reserve much more address space than they use,
+    # so the size of the data segment is limited instead of RLIMIT_AS where possible.
+    _RLIMIT_MEMORY = getattr(resource, 'RLIMIT_DATA', resource.RLIMIT_AS)
+
+_local = threading.local()
+
+
+class Limits(object):
+    '''Limits of the runtime processes serving a call.
+
+    timeout -- Seconds after which the call is aborted and its process killed.
+    max_memory -- Maximum size in bytes of the data memory of the process.
+    max_cpu_seconds -- Maximum CPU time of the process.
+    '''
+    def __init__(self, timeout=None, max_memory=None, max_cpu_seconds=None):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.max_cpu_seconds = max_cpu_seconds
+
+    def __bool__(self):
+        return not (self.timeout is None and self.max_memory is None and self.max_cpu_seconds is None)
+    __nonzero__ = __bool__
+
+    def override(self, timeout=None, max_memory=None, max_cpu_seconds=None):
+        '''Return the limits with the given ones replaced.'''
+        return Limits(
+            timeout=self.timeout if timeout is None else timeout,
+            max_memory=self.max_memory if max_memory is None else max_memory,
+            max_cpu_seconds=self.max_cpu_seconds if max_cpu_seconds is None else max_cpu_seconds,
+        )
+
+    def popen_options(self, new_session=None):
+        '''Return the keyword arguments of Popen which apply the limits.
+
+        new_session -- Whether the process starts a new session (and process group),
+            so that killing the group also kills its children. Defaults to True if any limit is set.
+
+        Running Python code between fork and exec is unsafe in threaded programs,
+        so a preexec_fn is only passed to set resource limits (or a session on Python 2),
+        and everything it needs is computed beforehand.
+        '''
+        if os.name != 'posix':
+            return {}
+        if new_session is None:
+            new_session = bool(self)
+
+        rlimits = []
+        if resource is not None:
+            if self.max_memory is not None:
+                rlimits.append((_RLIMIT_MEMORY, int(self.max_memory), int(self.max_memory)))
+            if self.max_cpu_seconds is not None:
+                # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored
+                seconds = int(math.ceil(self.max_cpu_seconds))
+                rlimits.append((resource.RLIMIT_CPU, seconds, seconds + 1))
+            rlimits = [_clamp(*rlimit) for rlimit in rlimits]
+        options = {}
+        setsid = new_session and six.PY2  # Popen has no start_new_session
+        if new_session and not setsid:
+            options['start_new_session'] = True
+        if setsid or rlimits:
+            setrlimit = resource and resource.setrlimit
+
+            def preexec():
+                if setsid:
+                    os.setsid()
+                for which, soft, hard in rlimits:
+                    setrlimit(which, (soft, hard))
+            options['preexec_fn'] = preexec
+        return options
+
+    def check(self, returncode, expired=False):
+        '''Raise TimeoutError if the process was killed for exceeding a time limit.
+
+        expired -- Whether the watchdog of the timeout has killed the process.
+        '''
+        if expired:
+            raise TimeoutError("JavaScript did not finish within {0} seconds".format(self.timeout))
+        sigxcpu = getattr(signal, 'SIGXCPU', None)
+        if self.max_cpu_seconds is not None and sigxcpu is not None and returncode == -sigxcpu:
+            raise TimeoutError("JavaScript exceeded {0} CPU seconds".format(self.max_cpu_seconds))
+
+
+def _clamp(which, soft, hard):
+    # an unprivileged process cannot raise its hard limit
+    current = resource.getrlimit(which)[1]
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    return which, soft, hard
+
+
+class Watchdog(object):
+    '''Calls kill after timeout seconds unless the with block has finished.'''
+    def __init__(self, timeout, kill):
+        self.timeout = timeout
+        self.expired = False
+        self._kill = kill
+        self._timer = None
+
+    def __enter__(self):
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _expire(self):
+        self.expired = True
+        self._kill()
+
+
+def kill(process):
+    '''Kill a Popen process, and its process group if it leads one.'''
+    if process.poll() is not None:
+        return
+    if hasattr(os, 'killpg'):
+        try:
+            if os.getpgid(process.pid) == process.pid:
+                os.killpg(process.pid, signal.SIGKILL)
+                return
+        except OSError:
+            pass
+    try:
+        process.kill()
+    except OSError:
+        pass  # already exited
+
+
+def current():
+    '''Return the limits of the call running in this thread, or None.'''
+    return getattr(_local, 'limits', None)
+
+
+def bound(func):
+    '''Return func, running with the limits current in this thread in whatever thread it is called.'''
+    limits = current()
+    if limits is None:
+        return func
+
+    def run(*args, **kwargs):
+        outer = current()
+        _local.limits = limits
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.limits = outer
+    return run
+
+
+@contextmanager
+def applied(default, **kwargs):
+    '''Make default.override(**kwargs) the limits of the calls made in this thread within the block.
+
+    In nested blocks, the limits of the outer block replace default.
+    '''
+    outer = current()
+    _local.limits = (outer or default).override(**kwargs)
+    try:
+        yield _local.limits
+    finally:
+        _local.limits = outer
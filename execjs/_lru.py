@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+
+
+class LRU(object):
+    '''Least-recently-used cache of results of pure calls, for compile(source, cache=...).
+
+    Results are stored as JSON, so callers never share mutable results with the cache.
+    Results which cannot be stored as JSON, such as binary data, are not cached.
+
+    maxsize -- Maximum number of entries, or None for no limit.
+    max_bytes -- Maximum total size of the stored JSON, or None for no limit.
+    ttl -- Seconds after which an entry expires, or None to keep entries until evicted.
+    '''
+    def __init__(self, maxsize=128, max_bytes=None, ttl=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()  # key -> (text, expires)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        '''Dictionary of hits, misses, evictions, entries and bytes.'''
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self._entries),
+                bytes=self._bytes,
+            )
+
+    def get(self, key):
+        '''Return (True, value) if key is cached, otherwise (False, None).'''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                self._bytes -= len(entry[0])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries[key] = entry
+            self.hits += 1
+        return True, json.loads(entry[0])
+
+    def put(self, key, value):
+        try:
+            text = json.dumps(value)
+        except TypeError:
+            return
+        if self.max_bytes is not None and len(text) > self.max_bytes:
+            return
+        expires = None if self.ttl is None else time.time() + self.ttl
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (text, expires)
+            self._bytes += len(text)
+
+            while (
+                (self.maxsize is not None and len(self._entries) > self.maxsize) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (text, _) = self._entries.popitem(last=False)
+                self._bytes -= len(text)
+                self.evictions += 1
+
+    def invalidate(self, prefix=()):
+        '''Remove the entries whose key tuple starts with prefix; all entries by default.'''
+        with self._lock:
+            n = len(prefix)
+            for key in [k for k in self._entries if k[:n] == prefix]:
+                text, _ = self._entries.pop(key)
+                self._bytes -= len(text)
+
+    def clear(self):
+        self.invalidate()
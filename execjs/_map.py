@@ -0,0 +1,80 @@
+'''Chunked parallel map of a JavaScript function over a Python iterable.'''
+from collections import deque
+import itertools
+
+from six.moves import queue
+
+import execjs._exceptions as exceptions
+
+
+def imap(context, name, iterable, chunksize=100, processes=None, ordered=True, return_exceptions=False):
+    '''Return an iterator of context.call(name, item) for each item of iterable (see AbstractRuntimeContext.map).
+
+    The arguments are checked, and the extra contexts started, before it returns.
+    '''
+    import multiprocessing
+
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+
+    results = _imap(context, name, iterable, chunksize, processes, ordered, return_exceptions)
+    # Run up to the first yield, so that closing or collecting the iterator closes the extra contexts.
+    next(results)
+    return results
+
+
+def _imap(context, name, iterable, chunksize, processes, ordered, return_exceptions):
+    # imported here to keep them out of the import time of execjs
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    contexts = [context]
+    try:
+        for _ in range(processes - 1):
+            contexts.append(context._replicate())
+        yield
+
+        idle = queue.Queue()
+        for c in contexts:
+            idle.put(c)
+
+        def run(chunk):
+            c = idle.get()
+            try:
+                return c.call_many(name, [(item,) for item in chunk])
+            finally:
+                idle.put(c)
+
+        items = iter(iterable)
+        chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+        executor = ThreadPoolExecutor(max_workers=processes)
+        # At most two chunks per process are read from iterable and not yet consumed.
+        pending = deque()
+        try:
+            for chunk in itertools.islice(chunks, 2 * processes):
+                pending.append(executor.submit(run, chunk))
+            while pending:
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    future = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+                    pending.remove(future)
+                results = future.result()
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append(executor.submit(run, chunk))
+
+                for result in results:
+                    if isinstance(result, exceptions.ProgramError) and not return_exceptions:
+                        raise result
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    finally:
+        for c in contexts[1:]:
+            if c is not context:
+                c.close()
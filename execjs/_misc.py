@@ -1,5 +1,28 @@
 import re
 
+import six
+
+
+class _CodepointEscapes(dict):
+    # str.translate table: ASCII maps to itself, other characters to JavaScript escapes.
+    # Escapes are computed on first use, so translating needs one Python call
+    # per distinct character rather than per character.
+    def __init__(self):
+        dict.__init__(self, ((i, i) for i in range(0x80)))
+
+    def __missing__(self, codepoint):
+        if codepoint > 0xffff:
+            # a surrogate pair, as JavaScript strings are UTF-16
+            codepoint -= 0x10000
+            escape = u'\\u{0:04x}\\u{1:04x}'.format(0xd800 + (codepoint >> 10), 0xdc00 + (codepoint & 0x3ff))
+        else:
+            escape = u'\\u{0:04x}'.format(codepoint)
+        self[codepoint] = escape
+        return escape
+
+
+_codepoint_escapes = _CodepointEscapes()
+
 
 def encode_unicode_codepoints(str):
     r"""
@@ -10,10 +33,35 @@ def encode_unicode_codepoints(str):
     True
     >>> encode_unicode_codepoints('\u4e16\u754c') == '\\u4e16\\u754c'
     True
+    >>> encode_unicode_codepoints('a\xe9\U0001f600') == 'a\\u00e9\\ud83d\\ude00'
+    True
     """
-    codepoint_format = '\\u{0:04x}'.format
+    if _is_ascii(str):
+        return str
+    if not isinstance(str, six.text_type):
+        # a byte string on Python 2, which translate cannot map to escapes
+        return _non_ascii.sub(lambda m: _codepoint_escapes[ord(m.group(0))], str)
+    return str.translate(_codepoint_escapes)
+
 
-    def codepoint(m):
-        return codepoint_format(ord(m.group(0)))
+def _is_ascii(str):
+    try:
+        return str.isascii()
+    except AttributeError:  # before Python 3.7
+        return _non_ascii.search(str) is None
 
-    return re.sub('[^\x00-\x7f]', codepoint, str)
+
+_non_ascii = re.compile('[^\x00-\x7f]')
+
+
+_identifier_path = re.compile(r'[A-Za-z_$][A-Za-z0-9_$]*(\.[A-Za-z_$][A-Za-z0-9_$]*)*\Z')
+
+
+def is_identifier_path(str):
+    r"""
+    >>> is_identifier_path("a.b.$c_1")
+    True
+    >>> is_identifier_path("a['b']") or is_identifier_path("1a") or is_identifier_path("a.")
+    False
+    """
+    return _identifier_path.match(str) is not None
@@ -0,0 +1,86 @@
+from six.moves import queue
+
+import execjs._runtimes as _runtimes
+
+
+class Pool(object):
+    '''Pool of long-lived runtime processes which have loaded the same source.
+
+    Requests are served by whichever process is idle, so CPU-bound JavaScript runs on
+    up to size cores in parallel.
+
+    source -- JavaScript code to load into every process.
+    size -- Number of processes. Defaults to the number of CPUs.
+    runtime -- Runtime to use. Defaults to execjs.get(). It must support persistent contexts.
+    cwd -- Directory where call JavaScript runtime.
+    cache_dir -- Directory to keep the compiled code cache of source in (see AbstractRuntime.compile).
+    timeout, max_memory, max_cpu_seconds -- Default limits of requests (see AbstractRuntime.compile).
+        Each request may override them with keyword arguments. A process killed
+        for exceeding a limit is replaced by a new one.
+    supervisor -- execjs.Supervisor managing the processes (see AbstractRuntime.compile).
+    '''
+    def __init__(self, source, size=None, runtime=None, cwd=None, cache_dir=None,
+                 timeout=None, max_memory=None, max_cpu_seconds=None, supervisor=None):
+        # imported here to keep them out of the import time of execjs
+        from concurrent.futures import ThreadPoolExecutor
+        import multiprocessing
+
+        if runtime is None:
+            runtime = _runtimes.get()
+        if size is None:
+            size = multiprocessing.cpu_count()
+
+        self._contexts = [
+            runtime.compile(
+                source, cwd=cwd, persistent=True, cache_dir=cache_dir,
+                timeout=timeout, max_memory=max_memory, max_cpu_seconds=max_cpu_seconds, supervisor=supervisor,
+            )
+            for _ in range(size)
+        ]
+        self._idle = queue.Queue()
+        for context in self._contexts:
+            self._idle.put(context)
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+        # start the processes in parallel; load errors are reported by the first request
+        for _ in self._contexts:
+            self._executor.submit(self._run, 'start')
+
+    @property
+    def size(self):
+        return len(self._contexts)
+
+    def submit(self, name, *args, **limits):
+        '''Call a JavaScript function on an idle process and return a concurrent.futures.Future of the result.'''
+        return self._executor.submit(self._run, 'call', name, *args, **limits)
+
+    def call(self, name, *args, **limits):
+        '''Call a JavaScript function on an idle process and return the result.'''
+        return self.submit(name, *args, **limits).result()
+
+    def eval(self, source, **limits):
+        '''Evaluate source on an idle process and return the result.'''
+        return self._executor.submit(self._run, 'eval', source, **limits).result()
+
+    def exec_(self, source, **limits):
+        '''Execute source on an idle process and return the result.'''
+        return self._executor.submit(self._run, 'exec_', source, **limits).result()
+
+    def close(self):
+        '''Wait for pending requests, then terminate all processes.'''
+        self._executor.shutdown(wait=True)
+        for context in self._contexts:
+            context.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self, method, *args, **limits):
+        context = self._idle.get()
+        try:
+            return getattr(context, method)(*args, **limits)
+        finally:
+            self._idle.put(context)
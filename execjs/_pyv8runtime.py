@@ -1,16 +1,59 @@
+import itertools
 import json
+import threading
 
 import execjs._exceptions as exceptions
+import execjs._runner_sources as _runner_sources
 from execjs._abstract_runtime import AbstractRuntime
 from execjs._abstract_runtime_context import AbstractRuntimeContext
-from execjs._misc import encode_unicode_codepoints
+from execjs._misc import encode_unicode_codepoints, is_identifier_path
 
-try:
-    import PyV8
-except ImportError:
-    _pyv8_available = False
-else:
-    _pyv8_available = True
+# PyV8 is imported on first use, so that importing execjs stays cheap.
+PyV8 = None
+_pyv8_available = None
+
+
+def _import_pyv8():
+    global PyV8, _pyv8_available
+    if _pyv8_available is None:
+        try:
+            import PyV8
+        except ImportError:
+            _pyv8_available = False
+        else:
+            _pyv8_available = True
+    return _pyv8_available
+
+
+# Results are marshalled by the function _marshal in V8: objects and arrays
+# cross into Python as JSON text in one piece, as ['json', text, value],
+# and other values as they are, as ['value', value].
+_marshal = '__execjs_marshal'
+_marshal_source = """var {0} = function(value) {{
+  if (value !== null && typeof value == 'object' && !(value instanceof Date)) {{
+    var text = JSON.stringify(value);
+    if (text !== undefined) {{
+      return ['json', text, value];
+    }}
+  }}
+  return ['value', value];
+}};""".format(_marshal)
+
+# Scopes of derived contexts, by key, as made by _runner_sources.NewScope.
+_scopes = '__execjs_scopes'
+
+# Program returning [invoke, arity] for a function bound with Context.function,
+# where invoke takes the arguments as JSON text and returns the marshalled result.
+_bind_source = """(function(f) {{
+  if (typeof f != 'function') {{
+    throw new TypeError({name} + ' is not a function');
+  }}
+  return [function(args) {{ return {marshal}(f.apply(this, JSON.parse(args))); }}, f.length];
+}})({function}())"""
+
+
+def _js_errors():
+    return (PyV8.JSError, IndexError, ReferenceError, SyntaxError, TypeError)
 
 
 class PyV8Runtime(AbstractRuntime):
@@ -22,65 +65,224 @@ class PyV8Runtime(AbstractRuntime):
     def name(self):
         return "PyV8"
 
-    def _compile(self, source, cwd=None):
+    def _compile(self, source, cwd=None, persistent=False, cache_dir=None, multiplexed=False, supervisor=None):
+        # PyV8 runs in this process, so every context is persistent (and thread-safe).
         return self.Context(source)
 
     def is_available(self):
-        return _pyv8_available
+        return _import_pyv8()
+
+    def _identity(self):
+        return [getattr(PyV8, '__file__', ''), str(getattr(PyV8, '__version__', ''))]
 
     class Context(AbstractRuntimeContext):
+        """Context whose source is run once into a JSContext kept for its lifetime.
+
+        Every exec_, eval and call runs only its own code against the global object
+        of that JSContext, so state is kept between calls.
+        Call close() (or use the context as a context manager) to release it.
+        """
+        _runtime_name = "PyV8"
+
         def __init__(self, source=""):
             self._source = source
+            self._encoded_source = str(encode_unicode_codepoints(source))
+            self._js_context = None
+            self._engine = None
+            self._lock = threading.Lock()
 
         def is_available(self):
-            return _pyv8_available
+            return _import_pyv8()
+
+        def close(self):
+            with self._lock:
+                self._js_context = None
+                self._engine = None
 
         def _exec_(self, source):
-            source = '''\
-            (function() {{
-                {0};
-                {1};
-            }})()'''.format(
-                encode_unicode_codepoints(self._source),
-                encode_unicode_codepoints(source)
-            )
-            source = str(source)
-
-            # backward compatibility
-            with PyV8.JSContext() as ctxt, PyV8.JSEngine() as engine:
-                js_errors = (PyV8.JSError, IndexError, ReferenceError, SyntaxError, TypeError)
-                try:
-                    script = engine.compile(source)
-                except js_errors as e:
-                    raise exceptions.ProgramError(e)
-                try:
-                    value = script.run()
-                except js_errors as e:
-                    raise exceptions.ProgramError(e)
-                return self.convert(value)
+            program = str(self._program(source))
+            with self._lock:
+                js_context = self._load()
+                with js_context:
+                    return self._unmarshal(self._run(program))
+
+        def _program(self, source):
+            return "{0}({1}())".format(_marshal, self._closure(source))
+
+        def _closure(self, source):
+            # an expression of a function running source in the scope of the context
+            return "(function() {{ {0}\n}})".format(encode_unicode_codepoints(source))
+
+        def _derive(self, source):
+            return PyV8Runtime.DerivedContext(self, source)
+
+        def _load(self):
+            # The source is run when first needed, and again if it failed.
+            if self._js_context is None:
+                js_context = PyV8.JSContext()
+                self._engine = PyV8.JSEngine()
+                with js_context:
+                    self._run(str(_marshal_source))
+                    self._run(self._encoded_source)
+                self._js_context = js_context
+            return self._js_context
+
+        def _run(self, source):
+            try:
+                script = self._engine.compile(source)
+            except _js_errors() as e:
+                raise exceptions.ProgramError(e)
+            try:
+                return script.run()
+            except _js_errors() as e:
+                raise exceptions.ProgramError(e)
+
+        def _bind(self, identifier):
+            # The function is looked up once per JSContext into a JavaScript function
+            # taking the arguments as JSON text, so that calls compile no program.
+            program = str(_bind_source.format(
+                name=json.dumps(identifier),
+                marshal=_marshal,
+                function=self._closure('return ' + identifier),
+            ))
+            bound = {}
+
+            def lookup():
+                js_context = self._load()
+                if bound.get('context') is not js_context:
+                    with js_context:
+                        result = self._run(program)
+                    bound.update(context=js_context, invoke=result[0], arity=result[1])
+                return js_context, bound['invoke']
+
+            def invoke(args):
+                args = json.dumps(args)
+                with self._lock:
+                    js_context, function = lookup()
+                    with js_context:
+                        try:
+                            marshalled = function(args)
+                        except _js_errors() as e:
+                            raise exceptions.ProgramError(e)
+                        return self._unmarshal(marshalled)
+
+            with self._lock:
+                lookup()
+            return invoke, bound['arity']
 
         def _eval(self, source):
             return self.exec_('return ' + encode_unicode_codepoints(source))
 
         def _call(self, identifier, *args):
             args = json.dumps(args)
+            if is_identifier_path(identifier):
+                # skip the second encoding pass of eval() over the arguments
+                return self.exec_('return ' + identifier + '.apply(this, ' + args + ')')
             return self.eval("{identifier}.apply(this, {args})".format(identifier=identifier, args=args))
 
         @classmethod
         def convert(cls, obj):
-            from PyV8 import _PyV8
-            if isinstance(obj, bytes):
-                return obj.decode('utf8')
-            if isinstance(obj, _PyV8.JSArray):
-                return [cls.convert(v) for v in obj]
-            elif isinstance(obj, _PyV8.JSFunction):
-                return None
-            elif isinstance(obj, _PyV8.JSObject):
-                ret = {}
-                for k in obj.keys():
-                    v = cls.convert(obj[k])
-                    if v is not None:
-                        ret[cls.convert(k)] = v
-                return ret
-            else:
-                return obj
+            """Convert a value of PyV8 to Python values, crossing into V8 once per item.
+
+            The conversion is iterative, so it does not depend on the depth of obj.
+            Items of objects which convert to None are left out.
+            """
+            root = []
+            # (value, container of its conversion, key in the container)
+            stack = [(obj, root, None)]
+            while stack:
+                value, container, key = stack.pop()
+                kind = cls._kind(value)
+                if kind == 'array':
+                    converted = [None] * len(value)
+                    stack.extend((v, converted, i) for i, v in enumerate(value))
+                elif kind == 'object':
+                    converted = {}
+                    # pushed in reverse, so that the keys are inserted in order
+                    for k in reversed(list(value.keys())):
+                        stack.append((value[k], converted, k.decode('utf8') if isinstance(k, bytes) else k))
+                elif kind == 'bytes':
+                    converted = value.decode('utf8')
+                elif kind == 'function':
+                    converted = None
+                else:
+                    converted = value
+
+                if container is root:
+                    root.append(converted)
+                elif converted is not None or isinstance(container, list):
+                    container[key] = converted
+            return root[0]
+
+        _kinds = {}  # type -> kind of conversion
+
+        @classmethod
+        def _kind(cls, obj):
+            kind = cls._kinds.get(type(obj))
+            if kind is None:
+                from PyV8 import _PyV8
+                if isinstance(obj, bytes):
+                    kind = 'bytes'
+                elif isinstance(obj, _PyV8.JSArray):
+                    kind = 'array'
+                elif isinstance(obj, _PyV8.JSFunction):
+                    kind = 'function'
+                elif isinstance(obj, _PyV8.JSObject):
+                    kind = 'object'
+                else:
+                    kind = 'value'
+                cls._kinds[type(obj)] = kind
+            return kind
+
+        def _unmarshal(self, marshalled):
+            kind = marshalled[0]
+            if kind == 'json':
+                try:
+                    return json.loads(self.convert(marshalled[1]))
+                except RuntimeError:
+                    # too deep for the json module (RecursionError is a RuntimeError)
+                    pass
+            return self.convert(marshalled[-1])
+
+
+    class DerivedContext(Context):
+        """Context whose source runs in a scope of its own in the JSContext of a base context.
+
+        Its declarations are local to its scope, while assignments to globals are
+        seen by the base context and its other derived contexts. The source is run
+        again if the base context has been closed since.
+        """
+        _scope_keys = itertools.count(1)
+
+        def __init__(self, base, source):
+            PyV8Runtime.Context.__init__(self, source)
+            self._base = base
+            self._lock = base._lock
+            self._scope = next(self._scope_keys)
+            self._scoped_context = None  # the JSContext the scope was made in
+
+        def close(self):
+            with self._lock:
+                js_context, self._scoped_context = self._scoped_context, None
+                if js_context is not None and js_context is self._base._js_context:
+                    with js_context:
+                        self._run(str("delete {0}[{1}];".format(_scopes, self._scope)))
+
+        def _closure(self, source):
+            code = json.dumps("(function() { " + source + "\n})")
+            return "{0}[{1}]({2})".format(_scopes, self._scope, code)
+
+        def _load(self):
+            js_context = self._base._load()
+            if self._scoped_context is not js_context:
+                with js_context:
+                    self._run(str("var {0} = {0} || {{}};\n{0}[{1}] = ({2})({3});".format(
+                        _scopes, self._scope, _runner_sources.NewScope, json.dumps(self._source))))
+                self._scoped_context = js_context
+            return js_context
+
+        def _run(self, source):
+            return self._base._run(source)
+
+        def _derive(self, source):
+            return self._base.derive(self._source + "\n" + source)
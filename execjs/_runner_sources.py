@@ -10,13 +10,15 @@ Node = r"""(function(program, execJS) { execJS(program) })(function() { #{source
     process.stdout.write('' + string + '\n');
   };
   try {
+    var start = new Date().getTime();
     result = program();
+    var elapsed = new Date().getTime() - start;
     print('')
     if (typeof result == 'undefined' && result !== null) {
-      print('["ok"]');
+      print('["ok",null,' + elapsed + ']');
     } else {
       try {
-        print(JSON.stringify(['ok', result]));
+        print(JSON.stringify(['ok', result, elapsed]));
       } catch (err) {
         print('["err"]');
       }
@@ -32,13 +34,15 @@ JavaScriptCore = r"""(function(program, execJS) { execJS(program) })(function()
 }, function(program) {
   var output;
   try {
+    var start = new Date().getTime();
     result = program();
+    var elapsed = new Date().getTime() - start;
     print("");
     if (typeof result == 'undefined' && result !== null) {
-      print('["ok"]');
+      print('["ok",null,' + elapsed + ']');
     } else {
       try {
-        print(JSON.stringify(['ok', result]));
+        print(JSON.stringify(['ok', result, elapsed]));
       } catch (err) {
         print('["err"]');
       }
@@ -54,13 +58,15 @@ SpiderMonkey = r"""(function(program, execJS) { execJS(program) })(function() {
   #{json2_source}
   var output;
   try {
+    var start = new Date().getTime();
     result = program();
+    var elapsed = new Date().getTime() - start;
     print("");
     if (typeof result == 'undefined' && result !== null) {
-      print('["ok"]');
+      print('["ok",null,' + elapsed + ']');
     } else {
       try {
-        print(JSON.stringify(['ok', result]));
+        print(JSON.stringify(['ok', result, elapsed]));
       } catch (err) {
         print('["err"]');
       }
@@ -83,13 +89,15 @@ JScript = r"""(function(program, execJS) { execJS(program) })(function() {
     WScript.Echo(string);
   };
   try {
+    var start = new Date().getTime();
     result = program();
+    var elapsed = new Date().getTime() - start;
     print("")
     if (typeof result == 'undefined' && result !== null) {
-      print('["ok"]');
+      print('["ok",null,' + elapsed + ']');
     } else {
       try {
-        print(JSON.stringify(['ok', result]));
+        print(JSON.stringify(['ok', result, elapsed]));
       } catch (err) {
         print('["err"]');
       }
@@ -109,13 +117,15 @@ PhantomJS = r"""
     console.log('' + string);
   };
   try {
+    var start = new Date().getTime();
     result = program();
+    var elapsed = new Date().getTime() - start;
     print('')
     if (typeof result == 'undefined' && result !== null) {
-      print('["ok"]');
+      print('["ok",null,' + elapsed + ']');
     } else {
       try {
-        print(JSON.stringify(['ok', result]));
+        print(JSON.stringify(['ok', result, elapsed]));
       } catch (err) {
         print('["err"]');
       }
@@ -128,3 +138,277 @@ phantom.exit();
 """
 
 SlimerJS = PhantomJS
+
+# Function which runs a context source in the global scope of Node.js.
+# If cachePath is given, V8's code cache for the source is read from and written to it.
+NodeLoadContext = r"""function(source, cachePath) {
+  var fs = require('fs');
+  var vm = require('vm');
+  var cachedData;
+  if (cachePath) {
+    try {
+      cachedData = fs.readFileSync(cachePath);
+    } catch (err) {
+    }
+  }
+  var script = new vm.Script(source, {filename: 'execjs-context.js', cachedData: cachedData});
+  script.runInThisContext();
+  if (cachePath && (cachedData === undefined || script.cachedDataRejected)) {
+    try {
+      var tempPath = cachePath + '.' + process.pid;
+      fs.writeFileSync(tempPath, script.createCachedData());
+      fs.renameSync(tempPath, cachePath);
+    } catch (err) {
+    }
+  }
+}"""
+
+# Function which runs the source of a derived context in a scope of its own,
+# inside the global scope, and returns a function evaluating code in that scope.
+NewScope = r"""function(source) {
+  return (0, eval)('(function() { ' + source + '\n;return function(__execjs_code) { return eval(__execjs_code); };\n})')();
+}"""
+
+# Long-lived Node.js process serving requests over stdin/stdout.
+# Each request and response is one line of JSON; responses are
+# [id, status, value, blob lengths, milliseconds] in the same shape as
+# the one-shot runners' output, where the trailing items are optional.
+NodeWorker = r"""(function() {
+  var vm = require('vm');
+  var write = process.stdout.write.bind(process.stdout);
+  process.stdout.write = process.stderr.write.bind(process.stderr);
+
+  // Binary values travel as blobs after the JSON line of a message,
+  // and as {"$execjs_binary": index, "type": type} placeholders inside it.
+  var encodeBinary = function(value, blobs) {
+    if (value === null || typeof value != 'object') {
+      return value;
+    }
+    if (value instanceof ArrayBuffer || ArrayBuffer.isView(value)) {
+      var isBuffer = value instanceof ArrayBuffer;
+      blobs.push(isBuffer ? Buffer.from(value) : Buffer.from(value.buffer, value.byteOffset, value.byteLength));
+      return {'$execjs_binary': blobs.length - 1, type: Buffer.isBuffer(value) ? 'Buffer' : value.constructor.name};
+    }
+    if (typeof value.toJSON == 'function') {
+      return value;
+    }
+    var copy = null;
+    var keys = Array.isArray(value) ? null : Object.keys(value);
+    var n = keys ? keys.length : value.length;
+    for (var i = 0; i < n; i++) {
+      var key = keys ? keys[i] : i;
+      var encoded = encodeBinary(value[key], blobs);
+      if (encoded !== value[key]) {
+        copy = copy || (keys ? Object.assign({}, value) : value.slice());
+        copy[key] = encoded;
+      }
+    }
+    return copy || value;
+  };
+
+  var decodeBinary = function(value, blobs) {
+    if (value === null || typeof value != 'object') {
+      return value;
+    }
+    if (value.hasOwnProperty('$execjs_binary')) {
+      var blob = blobs[value['$execjs_binary']];
+      if (value.type == 'Buffer') {
+        return blob;
+      }
+      var Type = global[value.type];
+      if (blob.byteOffset % Type.BYTES_PER_ELEMENT) {
+        blob = Buffer.from(blob);
+      }
+      return new Type(blob.buffer, blob.byteOffset, blob.byteLength / Type.BYTES_PER_ELEMENT);
+    }
+    for (var key in value) {
+      value[key] = decodeBinary(value[key], blobs);
+    }
+    return value;
+  };
+
+  var send = function(id, status, value, elapsed) {
+    var blobs = [];
+    var message;
+    if (typeof value == 'undefined' && value !== null) {
+      message = [id, status];
+    } else {
+      message = [id, status, encodeBinary(value, blobs)];
+    }
+    if (blobs.length || elapsed !== undefined) {
+      if (message.length == 2) {
+        message.push(null);
+      }
+      message.push(blobs.length ? blobs.map(function(blob) { return blob.length; }) : null);
+    }
+    if (elapsed !== undefined) {
+      message.push(elapsed);
+    }
+    write(JSON.stringify(message) + '\n');
+    blobs.forEach(function(blob) { write(blob); });
+  };
+  var respond = function(id, status, value, elapsed) {
+    try {
+      send(id, status, value, elapsed);
+    } catch (err) {
+      send(id, 'err');
+    }
+  };
+
+  var loadContext = #{load_context};
+
+  // Scopes of derived contexts by key. Requests with a scope run in it, and are
+  // answered with the status 'noscope' if it has not been created in this process.
+  var newScope = #{new_scope};
+  var scopes = {};
+
+  // Functions bound by key. Invoking one which has not been bound in this process
+  // is answered with the status 'nofunction'.
+  var functions = {};
+
+  var scripts = {};
+  var resolve = function(name) {
+    if (!scripts.hasOwnProperty(name)) {
+      scripts[name] = new vm.Script(name);
+    }
+    return scripts[name].runInThisContext();
+  };
+
+  var handlers = {
+    load: function(request) {
+      loadContext(request.code, request.cachePath);
+    },
+    scope: function(request) {
+      if (!scopes.hasOwnProperty(request.key)) {
+        scopes[request.key] = newScope(request.code);
+      }
+    },
+    drop: function(request) {
+      delete scopes[request.key];
+    },
+    ping: function(request) {
+    },
+    exec: function(request) {
+      var code = '(function() { ' + request.code + '\n})';
+      var program = request.scope === undefined ? vm.runInThisContext(code) : scopes[request.scope](code);
+      return program();
+    },
+    call: function(request) {
+      var func = request.scope === undefined ? resolve(request.name) : scopes[request.scope](request.name);
+      return func.apply(global, request.args);
+    },
+    bind: function(request) {
+      var func = request.scope === undefined ? resolve(request.name) : scopes[request.scope](request.name);
+      if (typeof func != 'function') {
+        throw new TypeError(request.name + ' is not a function');
+      }
+      functions[request.key] = func;
+      return func.length;
+    },
+    invoke: function(request) {
+      return functions[request.key].apply(global, request.args);
+    },
+    iter: function(request) {
+      var func = request.scope === undefined ? resolve(request.name) : scopes[request.scope](request.name);
+      var result = func.apply(global, request.args);
+      if (Array.isArray(result)) {
+        for (var i = 0; i < result.length; i++) {
+          send(request.id, 'item', result[i]);
+        }
+      } else {
+        for (var item of result) {
+          send(request.id, 'item', item);
+        }
+      }
+    }
+  };
+
+  var handle = function(request) {
+    var result;
+    var start = process.hrtime();
+    if (request.scope !== undefined && !scopes.hasOwnProperty(request.scope)) {
+      respond(request.id, 'noscope');
+      return;
+    }
+    if (request.op == 'invoke' && !functions.hasOwnProperty(request.key)) {
+      respond(request.id, 'nofunction');
+      return;
+    }
+    try {
+      result = handlers[request.op](request);
+    } catch (err) {
+      respond(request.id, 'err', '' + err);
+      return;
+    }
+    var milliseconds = function() {
+      var elapsed = process.hrtime(start);
+      return elapsed[0] * 1e3 + elapsed[1] / 1e6;
+    };
+    // Promises are settled before the response, while later requests are served.
+    if (result !== null && typeof result == 'object' && typeof result.then == 'function') {
+      result.then(function(value) {
+        respond(request.id, 'ok', value, milliseconds());
+      }, function(err) {
+        respond(request.id, 'err', '' + err);
+      });
+      return;
+    }
+    respond(request.id, 'ok', result, milliseconds());
+  };
+
+  // Split stdin into messages: a JSON line, then the blobs whose lengths it lists.
+  var chunks = [];
+  var length = 0;
+  var request = null;
+  var blobsLength = 0;
+  process.stdin.on('data', function(chunk) {
+    chunks.push(chunk);
+    length += chunk.length;
+    for (;;) {
+      var data;
+      if (request === null) {
+        // only the newest chunk can contain the end of the line
+        var newline = chunk.indexOf(10);
+        if (newline < 0) {
+          return;
+        }
+        data = Buffer.concat(chunks, length);
+        var end = length - chunk.length + newline;
+        var line = data.toString('utf8', 0, end);
+        chunk = data.slice(end + 1);
+        chunks = [chunk];
+        length = chunk.length;
+        try {
+          request = JSON.parse(line);
+        } catch (err) {
+          // skip the line, answering the request if its id can be found
+          var id = /"id": (\d+)(, "blobs": \[[\d, ]*\])?}$/.exec(line);
+          if (id) {
+            respond(+id[1], 'err', '' + err);
+          }
+          continue;
+        }
+        blobsLength = (request.blobs || []).reduce(function(a, b) { return a + b; }, 0);
+      }
+      if (length < blobsLength) {
+        return;
+      }
+      data = Buffer.concat(chunks, length);
+      if (request.blobs) {
+        var blobs = [];
+        var offset = 0;
+        request.blobs.forEach(function(n) {
+          blobs.push(data.slice(offset, offset + n));
+          offset += n;
+        });
+        request.args = decodeBinary(request.args, blobs);
+      }
+      handle(request);
+      request = null;
+      chunk = data.slice(blobsLength);
+      chunks = [chunk];
+      length = chunk.length;
+    }
+  });
+})();"""
+NodeWorker = NodeWorker.replace('#{load_context}', NodeLoadContext).replace('#{new_scope}', NewScope)
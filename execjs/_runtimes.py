@@ -12,14 +12,47 @@ def register(name, runtime):
     _runtimes.append((name, runtime))
 
 
-def get(name=None):
+def get(name=None, policy=None, profile=None):
     """
     Return a appropriate JavaScript runtime.
     If name is specified, return the runtime.
+
+    Otherwise, the runtime named by the EXECJS_RUNTIME environment variable is returned if it is available,
+    else the runtime chosen by policy among the available ones:
+
+    policy -- "first" (the default) chooses the first runtime in the order of registration.
+        "fastest" chooses the runtime with the lowest latency for profile, as measured by
+        a short probe of each runtime on first use (the results are cached on disk;
+        see execjs._calibration). Defaults to the EXECJS_RUNTIME_POLICY environment variable.
+    profile -- Workload profile for "fastest": "startup" for few calls in new contexts (the default),
+        or "throughput" for many calls on long-lived contexts.
+        Defaults to the EXECJS_RUNTIME_PROFILE environment variable.
     """
-    if name is None:
-        return get_from_environment() or _find_available_runtime()
-    return _find_runtime_by_name(name)
+    if name is not None:
+        return _find_runtime_by_name(name)
+
+    runtime = get_from_environment()
+    if runtime is not None:
+        return runtime
+
+    if policy is None:
+        # invalid values in the environment are ignored, like those of EXECJS_RUNTIME
+        policy = os.environ.get("EXECJS_RUNTIME_POLICY", "").lower()
+        if policy not in _policies:
+            policy = "first"
+    if policy not in _policies:
+        raise ValueError("unknown runtime policy: {0!r}".format(policy))
+
+    if policy == "fastest":
+        import execjs._calibration as _calibration
+        if profile is None:
+            profile = os.environ.get("EXECJS_RUNTIME_PROFILE", "").lower()
+            if profile not in _calibration.PROFILES:
+                profile = "startup"
+        runtime = _calibration.select(_runtimes, profile)
+        if runtime is not None:
+            return runtime
+    return _find_available_runtime()
 
 
 def runtimes():
@@ -42,6 +75,9 @@ def get_from_environment():
         return None
 
 
+_policies = ("first", "fastest")
+
+
 def _find_available_runtime():
     for _, runtime in _runtimes:
         if runtime.is_available():
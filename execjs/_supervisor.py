@@ -0,0 +1,99 @@
+'''Lifecycle management of the long-lived processes of persistent contexts.'''
+import threading
+import time
+import weakref
+
+
+class Supervisor(object):
+    '''Policy for the long-lived runtime processes of persistent contexts and pools, and their statistics.
+
+    A supervisor is given to AbstractRuntime.compile or Pool with supervisor=..., and may be
+    shared by any number of them.
+
+    prewarm -- Start a process as soon as its context is created, and start its replacement
+        as soon as it is replaced or found dead, so that requests do not wait for a cold start.
+    max_calls -- Replace a process after it has served this many requests.
+    max_rss -- Replace a process when its resident memory exceeds this many bytes.
+        It is read from /proc/<pid>/status (so only on Linux), at most once a second
+        after requests and at every ping.
+    ping_interval -- Seconds between liveness checks of idle processes. A process which has
+        died, or does not answer a ping within ping_timeout seconds, is killed and replaced.
+    drain_timeout -- Seconds a replaced process, or a closed process of a multiplexed context,
+        is given to answer the requests it has received and exit, before it is killed.
+    '''
+    def __init__(self, prewarm=False, max_calls=None, max_rss=None, ping_interval=None, ping_timeout=5.0,
+                 drain_timeout=5.0):
+        self.prewarm = prewarm
+        self.max_calls = max_calls
+        self.max_rss = max_rss
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('spawns', 'respawns', 'recycled_calls', 'recycled_memory', 'ping_failures', 'kills'), 0)
+        self._workers = weakref.WeakSet()
+        self._pinger = None
+
+    @property
+    def stats(self):
+        '''Counts of events of the supervised processes, as a dictionary:
+
+        spawns -- processes started.
+        respawns -- processes started to replace one which had died or was killed,
+            e.g. for a timeout or a failed ping.
+        recycled_calls, recycled_memory -- processes replaced for max_calls and max_rss.
+        ping_failures -- pings which were not answered.
+        kills -- processes killed because they did not exit within drain_timeout.
+        '''
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _register(self, worker):
+        with self._lock:
+            self._workers.add(worker)
+            if self.ping_interval is not None and self._pinger is None:
+                self._pinger = threading.Thread(target=self._ping_loop)
+                self._pinger.daemon = True
+                self._pinger.start()
+
+    def _ping_loop(self):
+        while True:
+            time.sleep(self.ping_interval)
+            with self._lock:
+                workers = list(self._workers)
+            for worker in workers:
+                try:
+                    worker._ping(self.ping_timeout)
+                except Exception:
+                    pass  # e.g. a process which cannot be started; the next request reports it
+            del workers
+
+    def _recycle_reason(self, worker, ping=False):
+        # Return the key of the stats for replacing the process of worker, or None.
+        if self.max_calls is not None and worker._calls >= self.max_calls:
+            return 'recycled_calls'
+        if self.max_rss is not None and worker._process is not None:
+            now = time.time()
+            if ping or now - worker._rss_checked >= 1.0:
+                worker._rss_checked = now
+                rss = resident_memory(worker._process.pid)
+                if rss is not None and rss > self.max_rss:
+                    return 'recycled_memory'
+        return None
+
+
+def resident_memory(pid):
+    '''Return the resident memory of a process in bytes, or None if it cannot be read.'''
+    try:
+        with open('/proc/{0}/status'.format(pid)) as fp:
+            for line in fp:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
@@ -0,0 +1,501 @@
+from subprocess import Popen, PIPE
+from collections import deque
+import functools
+import itertools
+import json
+import threading
+import time
+
+from execjs._exceptions import ProcessExitedWithNonZeroStatus
+import execjs._limits as _limits
+import execjs._binary as _binary
+import execjs._instrumentation as _instrumentation
+from execjs._binary import BinaryEncoder
+
+
+class Worker(object):
+    '''A long-lived JavaScript process that has loaded a context source.
+
+    Requests are sent as one line of JSON on stdin and answered by one line of JSON
+    on stdout. The process is started on the first request and started again
+    (reloading the context source) when it has died.
+    With a Supervisor, the process is also started in advance, pinged, and replaced
+    after too many requests or when it uses too much memory (see Supervisor).
+    '''
+    stderr_lines = 100
+    # Whether close gives the process the drain timeout of the supervisor to exit.
+    # A process served one request at a time has no request in flight when it is closed.
+    _drain_on_close = False
+
+    def __init__(self, command, source, cwd=None, code_cache=None, code_cache_path=None, popen_options=None,
+                 supervisor=None):
+        self._command = command
+        self._popen_options = popen_options or {}
+        self._source = source
+        self._cwd = cwd
+        self._code_cache = code_cache
+        self._code_cache_path = code_cache_path
+        self._process = None
+        self._stderr = deque(maxlen=self.stderr_lines)
+        self._drainer = None
+        self._ids = itertools.count(1)
+        self._lost = False  # whether the process has died unexpectedly
+        self._calls = 0  # requests served by the process
+        self._rss_checked = 0.0
+        # held while serving requests, so that the supervisor pings only idle processes
+        self._busy = threading.RLock()
+        self._supervisor = supervisor
+        if supervisor is not None:
+            supervisor._register(self)
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        '''Start the process and load the context source into it, unless it is already running.
+
+        Return the (status, value) response to loading the source.
+        '''
+        with self._busy:
+            if self.alive:
+                return 'ok', None
+            return self._start()
+
+    def _start(self):
+        respawn = self._lost or self._process is not None
+        self.close()
+        self._lost = False
+        self._calls = 0
+        self._stderr = deque(maxlen=self.stderr_lines)
+        # keyword arguments of Popen, or a function returning them when the process starts
+        options = self._popen_options() if callable(self._popen_options) else self._popen_options
+        with _instrumentation.phase('spawn'):
+            self._process = Popen(
+                self._command, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=self._cwd, **options)
+        self._drainer = _start_daemon(_drain, self._process.stderr, self._stderr)
+        if self._supervisor is not None:
+            self._supervisor._count('spawns')
+            if respawn:
+                self._supervisor._count('respawns')
+
+        with _instrumentation.phase('load'):
+            if self._code_cache is None:
+                status, value = self._request('load', code=self._source, cachePath=None)
+            else:
+                with self._code_cache.load(self._code_cache_path):
+                    status, value = self._request('load', code=self._source, cachePath=self._code_cache_path)
+        if status != 'ok':
+            self.close()
+        return status, value
+
+    def request(self, op, **fields):
+        '''Send a request to the process and return its (status, value) response.'''
+        with self._busy:
+            if not self.alive:
+                status, value = self.start()
+                if status != 'ok':
+                    return status, value
+            with _instrumentation.phase('first_byte'):
+                request_id = self._send(op, fields)
+                response = self._readline()
+            result = self._parse(request_id, response)
+            self._served()
+            return result
+
+    def request_iter(self, op, **fields):
+        '''Send a request to the process and yield its (status, value) responses as they arrive.
+
+        The responses are ('item', value) pairs followed by one final response.
+        '''
+        with self._busy:
+            if not self.alive:
+                status, value = self.start()
+                if status != 'ok':
+                    yield status, value
+                    return
+            request_id = self._send(op, fields)
+            while True:
+                status, value = self._receive(request_id)
+                if status != 'item':
+                    self._served()
+                yield status, value
+                if status != 'item':
+                    return
+
+    def close(self):
+        '''Terminate the process. It is started again by the next request.'''
+        with self._busy:
+            p, self._process = self._process, None
+            if p is not None:
+                self._retire(p, self._drain_on_close)
+
+    def kill(self):
+        '''Kill the process. A request waiting for it fails, and the next request starts it again.'''
+        p = self._process
+        if p is not None:
+            _limits.kill(p)
+            p.wait()
+
+    def _request(self, op, **fields):
+        return self._receive(self._send(op, fields))
+
+    def _send(self, op, fields):
+        request_id = next(self._ids)
+        message = self._encode(op, fields, request_id)
+        try:
+            self._write(self._process, message)
+        except (IOError, OSError):
+            self._fail()
+        return request_id
+
+    @staticmethod
+    def _encode(op, fields, request_id):
+        # Return the chunks of the message: a JSON line, then the blobs.
+        # NaN and infinities, which JSON.parse rejects, raise ValueError before anything is sent.
+        fields['op'] = op
+        fields['id'] = request_id
+        encoder = BinaryEncoder()
+        line = json.dumps(fields, ensure_ascii=True, allow_nan=False, default=encoder.default)
+        if encoder.blobs:
+            # insert the lengths before the closing brace of the message
+            line = line[:-1] + ', "blobs": ' + json.dumps([blob.nbytes for blob in encoder.blobs]) + '}'
+        return [line.encode('ascii') + b'\n'] + encoder.blobs
+
+    @staticmethod
+    def _write(process, message):
+        for chunk in message:
+            process.stdin.write(chunk)
+        process.stdin.flush()
+
+    def _receive(self, request_id):
+        return self._parse(request_id, self._readline())
+
+    def _readline(self):
+        try:
+            response = self._process.stdout.readline()
+        except (IOError, OSError):
+            response = b''
+        if not response:
+            self._fail()
+        return response
+
+    def _parse(self, request_id, response):
+        response_id, status, value = self._decode(response, self._read_blob)
+        assert response_id == request_id
+        return status, value
+
+    @staticmethod
+    def _decode(response, read_blob):
+        # [id, status, value, blob lengths, milliseconds] with optional trailing items
+        with _instrumentation.phase('decode'):
+            ret = json.loads(response.decode('utf8'))
+        status = ret[1]
+        value = ret[2] if len(ret) > 2 else None
+        output_bytes = len(response)
+        if len(ret) > 3 and ret[3] is not None:
+            blobs = [read_blob(n) for n in ret[3]]
+            output_bytes += sum(ret[3])
+            value = _binary.decode(value, blobs)
+        if len(ret) > 4:
+            _instrumentation.record(execute=ret[4] / 1000.0)
+        _instrumentation.record(output_bytes=output_bytes)
+        return ret[0], status, value
+
+    def _read_blob(self, n):
+        try:
+            blob = self._process.stdout.read(n)
+        except (IOError, OSError):
+            blob = b''
+        if len(blob) < n:
+            self._fail()
+        return blob
+
+    def _fail(self):
+        p = self._process
+        p.wait()
+        self._drainer.join()
+        stderr = ''.join(self._stderr)
+        self.close()
+        self._lost = True
+        raise ProcessExitedWithNonZeroStatus(status=p.returncode, stdout='', stderr=stderr)
+
+    def prewarm(self):
+        '''Start the process in a background thread. Errors are reported by the first request.'''
+        def start():
+            try:
+                self.start()
+            except (OSError, ProcessExitedWithNonZeroStatus):
+                pass
+        _start_daemon(start)
+
+    def _served(self):
+        # Count a request, and replace the process if the supervisor says so.
+        self._calls += 1
+        if self._supervisor is not None:
+            reason = self._supervisor._recycle_reason(self)
+            if reason is not None:
+                self._recycle(reason)
+
+    def _recycle(self, reason):
+        self._supervisor._count(reason)
+        p, self._process = self._process, None
+        if p is not None:
+            _start_daemon(self._retire, p, True)
+        if self._supervisor.prewarm:
+            self.prewarm()
+
+    def _retire(self, p, drain=False):
+        # Close the input of a process, so that it exits when it has answered the requests
+        # it has read, and kill it if it has not exited within the drain timeout,
+        # or at once unless drain is true.
+        self._close_input(p)
+        timeout = self._supervisor.drain_timeout if drain and self._supervisor is not None else 0
+        if not _wait(p, timeout):
+            if timeout and self._supervisor is not None:
+                self._supervisor._count('kills')
+            _limits.kill(p)
+        p.wait()
+        p.stdout.close()
+
+    def _close_input(self, p):
+        try:
+            p.stdin.close()
+        except (IOError, OSError):
+            pass
+
+    def _ping(self, timeout):
+        # Called by the supervisor: check that an idle process answers within timeout seconds,
+        # and replace it if it does not or uses too much memory.
+        if not self._busy.acquire(False):
+            return
+        try:
+            p = self._process
+            if p is None:
+                return
+            try:
+                with _limits.Watchdog(timeout, functools.partial(_limits.kill, p)):
+                    status, value = self._request('ping')
+            except ProcessExitedWithNonZeroStatus:
+                status = None
+            if status == 'ok':
+                reason = self._supervisor._recycle_reason(self, ping=True)
+                if reason is not None:
+                    self._recycle(reason)
+                return
+            self._supervisor._count('ping_failures')
+            if self._supervisor.prewarm:
+                self.start()
+        finally:
+            self._busy.release()
+
+
+class MultiplexedWorker(Worker):
+    '''A Worker which serves requests from many threads at once.
+
+    Each request is written as soon as it is made, without waiting for the responses
+    to earlier ones, and a reader thread routes every response to the thread waiting
+    for it by the id of its request. If the process dies, the requests in flight fail
+    and the next request starts it again. A process replaced by the Supervisor
+    answers the requests in flight before it exits. request_iter is not supported.
+    '''
+    _drain_on_close = True
+
+    def __init__(self, *args, **kwargs):
+        self._start_lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._channel = None
+        Worker.__init__(self, *args, **kwargs)
+
+    def start(self):
+        status, value, _, _ = self._connect()
+        return status, value
+
+    def request(self, op, **fields):
+        status, value, process = self._roundtrip(op, fields)
+        if process is not None:
+            self._served_by(process)
+        return status, value
+
+    def _served_by(self, process):
+        # Count a request answered by process, unless it has been replaced meanwhile.
+        with self._start_lock:
+            if process is self._process:
+                self._served()
+
+    def _roundtrip(self, op, fields):
+        # Return the response to a request and the process which answered it;
+        # the process is None if it could not be started.
+        waiter = _Waiter()
+        status, value, process, _ = self._submit(op, fields, waiter)
+        if process is None:
+            return status, value, None
+        status, value = waiter.wait()
+        return status, value, process
+
+    def _submit(self, op, fields, waiter):
+        # Send a request whose response goes to waiter. Return the response to starting
+        # the process, the process (None if it could not be started), and a function
+        # which abandons the request, so that its response is discarded.
+        while True:
+            status, value, process, channel = self._connect()
+            if status != 'ok':
+                return status, value, None, None
+
+            request_id = next(self._ids)
+            message = self._encode(op, dict(fields), request_id)
+            with self._write_lock:
+                if process.stdin.closed:
+                    continue  # replaced meanwhile
+                channel.register(request_id, waiter)
+                try:
+                    self._write(process, message)
+                except (IOError, OSError):
+                    pass  # the process has exited; the reader fails the waiter
+            return status, value, process, functools.partial(channel.discard, request_id)
+
+    def request_iter(self, op, **fields):
+        raise NotImplementedError("MultiplexedWorker does not support request_iter")
+
+    def _recycle(self, reason):
+        with self._start_lock:
+            Worker._recycle(self, reason)
+
+    def _close_input(self, p):
+        with self._write_lock:
+            Worker._close_input(self, p)
+
+    def _ping(self, timeout):
+        p = self._process
+        if p is None:
+            return
+        status = None
+        if p.poll() is None:
+            try:
+                with _limits.Watchdog(timeout, functools.partial(_limits.kill, p)):
+                    status, value, process = self._roundtrip('ping', {})
+            except ProcessExitedWithNonZeroStatus:
+                pass
+        if status == 'ok':
+            with self._start_lock:
+                if process is self._process:
+                    reason = self._supervisor._recycle_reason(self, ping=True)
+                    if reason is not None:
+                        self._recycle(reason)
+            return
+        self._supervisor._count('ping_failures')
+        if self._supervisor.prewarm:
+            self.start()
+
+    def _connect(self):
+        # Return the response to loading the source and the process and channel to use.
+        with self._start_lock:
+            if self.alive:
+                return 'ok', None, self._process, self._channel
+            status, value = Worker.start(self)
+            if status != 'ok':
+                return status, value, None, None
+            self._channel = _Channel()
+            _start_daemon(self._read, self._process, self._drainer, self._stderr, self._channel)
+            return status, value, self._process, self._channel
+
+    def _read(self, process, drainer, stderr, channel):
+        def read_blob(n):
+            blob = process.stdout.read(n)
+            if len(blob) < n:
+                raise EOFError
+            return blob
+
+        try:
+            for response in iter(process.stdout.readline, b''):
+                request_id, status, value = self._decode(response, read_blob)
+                channel.resolve(request_id, (status, value))
+        except (IOError, OSError, ValueError, EOFError):
+            pass  # closed, or killed while writing a response
+        _limits.kill(process)
+        process.wait()
+        drainer.join()
+        channel.fail(ProcessExitedWithNonZeroStatus(status=process.returncode, stdout='', stderr=''.join(stderr)))
+
+
+class _Channel(object):
+    '''Waiters for the responses of one process of a MultiplexedWorker.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._error = None
+
+    def register(self, request_id, waiter):
+        with self._lock:
+            if self._error is None:
+                self._waiters[request_id] = waiter
+        if self._error is not None:
+            waiter.fail(self._error)
+
+    def discard(self, request_id):
+        with self._lock:
+            self._waiters.pop(request_id, None)
+
+    def resolve(self, request_id, result):
+        with self._lock:
+            waiter = self._waiters.pop(request_id, None)
+        if waiter is not None:
+            waiter.set(result)
+
+    def fail(self, error):
+        with self._lock:
+            self._error = error
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+        for waiter in waiters:
+            waiter.fail(error)
+
+
+class _Waiter(object):
+    '''Waiter of a thread for the response to a request of a MultiplexedWorker.
+
+    set and fail are called by the reader thread.
+    '''
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def set(self, result):
+        self._result = result
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            # a copy for each thread, as the traceback is set on the exception raised
+            import copy
+            raise copy.copy(self._error)
+        return self._result
+
+
+def _drain(stream, lines):
+    for line in iter(stream.readline, b''):
+        lines.append(line.decode('utf8', 'replace'))
+    stream.close()
+
+
+def _wait(process, timeout):
+    '''Wait up to timeout seconds for a process to exit, and return whether it has.'''
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _start_daemon(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
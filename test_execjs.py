@@ -4,6 +4,10 @@ from __future__ import unicode_literals
 import sys
 import os
 import doctest
+import json
+import shutil
+import tempfile
+import time
 import six
 
 import execjs
@@ -23,11 +27,65 @@ class RuntimeTestBase:
         context = self.runtime.compile("a = {}; a.b = {}; a.b.id = function(v) { return v; }")
         self.assertEqual("bar", context.call("a.b.id", "bar"))
 
+    def test_context_call_expression(self):
+        context = self.runtime.compile("a = {b: [function(v) { return v; }]}")
+        self.assertEqual("bar", context.call("a.b[0]", "bar"))
+
+    def test_context_call_large_arguments(self):
+        context = self.runtime.compile("id = function(v) { return v; }")
+        value = {"s": "\u3042'\"\\</script>\u2028" * 1000, "a": list(range(1000))}
+        self.assertEqual(value, context.call("id", value))
+
+    def test_context_call_many(self):
+        context = self.runtime.compile("a = {}; a.div = function(x, y) { if (!y) throw 'zero'; return x / y; }")
+        results = context.call_many("a.div", [(6, 3), (1, 0), [9, 3]])
+        self.assertEqual(2, results[0])
+        self.assertIsInstance(results[1], execjs.ProgramError)
+        self.assertEqual(3, results[2])
+        self.assertEqual([], context.call_many("a.div", []))
+        with self.assertRaises(execjs.Error):
+            context.call_many("missing", [()])
+
+    def test_context_map(self):
+        context = self.runtime.compile("a = {}; a.inv = function(x) { if (!x) throw 'zero'; return 1 / x; }")
+        items = [1, 2, 4, 5, 8]
+        expected = [1, 0.5, 0.25, 0.2, 0.125]
+        self.assertEqual(expected, list(context.map("a.inv", items, chunksize=2, processes=2)))
+        self.assertEqual(sorted(expected), sorted(context.imap_unordered("a.inv", iter(items), chunksize=2, processes=2)))
+        results = list(context.map("a.inv", [1, 0, 2], processes=1, return_exceptions=True))
+        self.assertIsInstance(results[1], execjs.ProgramError)
+        self.assertEqual([1, 0.5], [results[0], results[2]])
+        results = context.map("a.inv", [1, 0, 2], chunksize=1, processes=1)
+        self.assertEqual(1, next(results))
+        with self.assertRaises(execjs.ProgramError):
+            next(results)
+        with self.assertRaises(ValueError):
+            context.map("a.inv", items, chunksize=0)
+        with self.assertRaises(ValueError):
+            context.imap_unordered("a.inv", items, processes=0)
+
+    def test_context_call_iter(self):
+        context = self.runtime.compile("function range(n) { var a = []; for (var i = 0; i < n; i++) a.push(i); return a; }")
+        self.assertEqual([0, 1, 2], list(context.call_iter("range", 3)))
+        self.assertEqual([], list(context.call_iter("range", 0)))
+
     def test_context_call_missing_function(self):
         context = self.runtime.compile("")
         with self.assertRaises(execjs.Error):
             context.call("missing")
 
+    def test_context_function(self):
+        context = self.runtime.compile("a = {b: {add: function(x, y) { return x + y; }}}; n = 1")
+        add = context.function("a.b.add")
+        self.assertIsInstance(add, execjs.Function)
+        self.assertEqual(2, add.arity)
+        self.assertEqual(3, add(1, 2))
+        self.assertEqual("xy", add("x", "y"))
+        with self.assertRaises(execjs.ProgramError):
+            context.function("missing")
+        with self.assertRaises(execjs.ProgramError):
+            context.function("n")
+
     def test_exec(self):
         self.assertIsNone(self.runtime.exec_("1"))
         self.assertIsNone(self.runtime.exec_("return"))
@@ -95,6 +153,771 @@ class NodeRuntimeTest(unittest.TestCase, RuntimeTestBase):
     def setUp(self):
         self.runtime = execjs.get('Node')
 
+    def test_derive(self):
+        base = self.runtime.compile("function twice(x) { return 2 * x; }")
+        self.assertEqual(4, base.derive("function f(x) { return twice(x); }").call("f", 2))
+
+class PersistentRuntime(object):
+    def __init__(self, runtime):
+        self._runtime = runtime
+
+    def compile(self, source):
+        return self._runtime.compile(source, persistent=True)
+
+    def exec_(self, source):
+        with self.compile('') as context:
+            return context.exec_(source)
+
+    def eval(self, source):
+        with self.compile('') as context:
+            return context.eval(source)
+
+class NodePersistentRuntimeTest(unittest.TestCase, RuntimeTestBase):
+    def setUp(self):
+        self.runtime = PersistentRuntime(execjs.get('Node'))
+
+    def test_state_is_kept_between_calls(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }") as context:
+            self.assertEqual(1, context.call("inc"))
+            self.assertEqual(2, context.call("inc"))
+            self.assertEqual(3, context.eval("inc()"))
+
+    def test_respawn_after_crash(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }") as context:
+            self.assertEqual(1, context.call("inc"))
+            with self.assertRaises(execjs.RuntimeError):
+                context.exec_("process.exit(3)")
+            self.assertEqual(1, context.call("inc"))
+
+    def test_promise(self):
+        with self.runtime.compile("function later(x) { return Promise.resolve(x); }") as context:
+            self.assertEqual(1, context.call("later", 1))
+
+    def test_invalid_json(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }") as context:
+            self.assertEqual(1, context.call("inc"))
+            with self.assertRaises(ValueError):
+                context.call("inc", float("nan"))
+            self.assertEqual(2, context.call("inc"))
+            context._worker._write(context._worker._process, [b'{"op": "call", "id": \n'])
+            self.assertEqual(3, context.call("inc"))
+
+    def test_derive(self):
+        with self.runtime.compile("var loads = (this.loads || 0) + 1; function twice(x) { return 2 * x; }") as base:
+            a = base.derive("var name = 'a'; function f(x) { return name + twice(x); }")
+            b = base.derive("var name = 'b'; function f(x) { return name + twice(x); }")
+            self.assertEqual("a2", a.call("f", 1))
+            self.assertEqual("b4", b.call("f", 2))
+            self.assertEqual("undefined", base.eval("typeof f"))
+            self.assertEqual(1, b.eval("loads"))
+            self.assertEqual("a!", a.derive("function g() { return name + '!'; }").call("g"))
+
+            with self.assertRaises(execjs.RuntimeError):
+                base.exec_("process.exit(3)")
+            self.assertEqual("a6", a.call("f", 3))
+            a.close()
+            self.assertEqual("b8", b.call("f", 4))
+            with self.assertRaises(execjs.ProgramError):
+                base.derive("throw new Error('broken')").eval("1")
+
+    def test_map_reads_lazily(self):
+        import itertools
+        read = []
+
+        def items():
+            for i in itertools.count():
+                read.append(i)
+                yield i
+
+        with self.runtime.compile("function id(x) { return x; }") as context:
+            results = context.map("id", items(), chunksize=10, processes=2)
+            self.assertEqual(list(range(25)), list(itertools.islice(results, 25)))
+            results.close()
+            self.assertLessEqual(len(read), 80)
+
+    def test_function_after_crash(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }") as context:
+            inc = context.function("inc")
+            self.assertEqual(1, inc())
+            with self.assertRaises(execjs.RuntimeError):
+                context.exec_("process.exit(3)")
+            self.assertEqual(1, inc())
+            derived = context.derive("function twice() { return 2 * inc(); }")
+            self.assertEqual(4, derived.function("twice")())
+
+    def test_program_error_in_source(self):
+        with self.runtime.compile("throw new Error('broken')") as context:
+            with self.assertRaises(execjs.ProgramError):
+                context.eval("1")
+
+    def test_unsupported_runtime(self):
+        runtime = execjs.ExternalRuntime("python", ["python"], "")
+        with self.assertRaises(execjs.RuntimeUnavailableError):
+            runtime.compile("", persistent=True)
+
+class MultiplexedRuntime(PersistentRuntime):
+    def compile(self, source):
+        return self._runtime.compile(source, multiplexed=True)
+
+class NodeMultiplexedRuntimeTest(unittest.TestCase, RuntimeTestBase):
+    def setUp(self):
+        self.runtime = MultiplexedRuntime(execjs.get('Node'))
+
+    def test_promise(self):
+        with self.runtime.compile("function later(x) { return new Promise(function(resolve) { resolve(x); }); }") as context:
+            self.assertEqual(1, context.call("later", 1))
+
+    def test_nan_argument(self):
+        with self.runtime.compile("function echo(x) { return x; }") as context:
+            with self.assertRaises(ValueError):
+                context.call("echo", float("inf"))
+            self.assertEqual(1, context.call("echo", 1))
+            with self.assertRaises(execjs.ProgramError):
+                context.eval("Promise.reject(new Error('rejected'))")
+
+    def test_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        source = """
+        function add(x, y) { return x + y; }
+        function later(x, ms) { return new Promise(function(resolve) { setTimeout(function() { resolve(x); }, ms); }); }
+        """
+        def run(i):
+            if i % 2:
+                return context.call("later", i, i % 7)
+            return context.call("add", i, 0)
+
+        with self.runtime.compile(source) as context:
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                self.assertEqual(list(range(400)), list(executor.map(run, range(400))))
+
+    def test_promises_overlap(self):
+        from concurrent.futures import ThreadPoolExecutor
+        source = "function sleep(ms) { return new Promise(function(resolve) { setTimeout(resolve, ms); }); }"
+        with self.runtime.compile(source) as context:
+            context.start()
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                list(executor.map(lambda _: context.call("sleep", 200), range(10)))
+            self.assertLess(time.time() - start, 1.5)
+
+    def test_respawn_after_crash(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }") as context:
+            self.assertEqual(1, context.call("inc"))
+            with self.assertRaises(execjs.RuntimeError):
+                context.exec_("process.exit(3)")
+            self.assertEqual(1, context.call("inc"))
+
+    def test_timeout(self):
+        with self.runtime.compile("function add(x, y) { return x + y; }") as context:
+            with self.assertRaises(execjs.TimeoutError):
+                context.eval("(function() { while (true) {} })()", timeout=1)
+            self.assertEqual(3, context.call("add", 1, 2))
+
+_node_context_loader = "require('vm').runInThisContext(require('fs').readFileSync({path}, 'utf8'));"
+
+
+def use_tempfile_dir(test):
+    # runner and context files go to a directory removed after the test
+    import execjs._external_runtime as external_runtime
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    test.addCleanup(setattr, external_runtime, "_tempfile_dir_cache", external_runtime._tempfile_dir_cache)
+    external_runtime._tempfile_dir_cache = directory
+    return directory
+
+
+class NodeContextFileRuntimeTest(unittest.TestCase, RuntimeTestBase):
+    def setUp(self):
+        self.directory = use_tempfile_dir(self)
+        self.runtime = execjs.ExternalRuntime(
+            "Node", ["node"], execjs._runner_sources.Node,
+            tempfile=True, context_loader=_node_context_loader,
+        )
+
+    def test_context_file_is_reused(self):
+        source = "var n = 0; function inc() { return ++n; }"
+        context = self.runtime.compile(source)
+        self.assertEqual(1, context.call("inc"))
+        filename = context._context_file()
+        mtime = os.stat(filename).st_mtime
+        self.assertEqual(1, self.runtime.compile(source).call("inc"))
+        self.assertEqual(mtime, os.stat(filename).st_mtime)
+
+    def test_unused_context_files_are_pruned(self):
+        import execjs._external_runtime as external_runtime
+        old = os.path.join(self.directory, "execjs-context-old.js")
+        recent = os.path.join(self.directory, "execjs-context-recent.js")
+        for filename, age in ((old, external_runtime.CONTEXT_FILE_MAX_AGE + 1), (recent, 1)):
+            with open(filename, "w") as fp:
+                fp.write("var x;")
+            os.utime(filename, (time.time() - age, time.time() - age))
+        self.assertEqual(1, self.runtime.compile("var n = 1;").eval("n"))
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_shared_directory_must_be_private(self):
+        import execjs._external_runtime as external_runtime
+        self.assertTrue(external_runtime._is_private_directory(self.directory))
+        os.chmod(self.directory, 0o777)
+        self.assertFalse(external_runtime._is_private_directory(self.directory))
+        os.chmod(self.directory, 0o700)
+        link = self.directory + "-link"
+        os.symlink(self.directory, link)
+        try:
+            self.assertFalse(external_runtime._is_private_directory(link))
+        finally:
+            os.remove(link)
+
+
+_node_encoded_runner = "var print = function(s) { console.log(s) };\n" + execjs._runner_sources.JavaScriptCore
+
+
+class NodeEncodedRuntimeTest(unittest.TestCase, RuntimeTestBase):
+    def setUp(self):
+        self.runtime = execjs.ExternalRuntime("Node", ["node"], _node_encoded_runner)
+
+    def test_context_source_is_escaped_once(self):
+        import execjs._external_runtime as external_runtime
+        encode = external_runtime.encode_unicode_codepoints
+        encoded = []
+
+        def counting_encode(s):
+            encoded.append(s)
+            return encode(s)
+
+        external_runtime.encode_unicode_codepoints = counting_encode
+        try:
+            context = self.runtime.compile("var greeting = '\u3053\u3093\u306b\u3061\u306f';")
+            self.assertEqual(0, len(encoded))
+            for _ in range(2):
+                self.assertEqual("\u3053\u3093\u306b\u3061\u306f", context.eval("greeting"))
+            self.assertEqual(3, len(encoded))  # the context source once, and the two evaluated sources
+        finally:
+            external_runtime.encode_unicode_codepoints = encode
+
+
+class NodeEncodedContextFileRuntimeTest(NodeEncodedRuntimeTest):
+    def setUp(self):
+        use_tempfile_dir(self)
+        self.runtime = execjs.ExternalRuntime(
+            "Node", ["node"], _node_encoded_runner,
+            tempfile=True, context_loader=_node_context_loader,
+        )
+
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = execjs.Pool("function add(x, y) { return x + y; }", size=2, runtime=execjs.get('Node'))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_call(self):
+        self.assertEqual(2, self.pool.size)
+        self.assertEqual(3, self.pool.call("add", 1, 2))
+        self.assertEqual(3, self.pool.eval("add(1, 2)"))
+        self.assertEqual(3, self.pool.exec_("return add(1, 2)"))
+
+    def test_submit(self):
+        futures = [self.pool.submit("add", i, i) for i in range(10)]
+        self.assertEqual([i * 2 for i in range(10)], [f.result() for f in futures])
+
+    def test_program_error(self):
+        with self.assertRaises(execjs.ProgramError):
+            self.pool.submit("missing").result()
+
+    def test_timeout_replaces_process(self):
+        with self.assertRaises(execjs.TimeoutError):
+            self.pool.eval("(function() { while (true) {} })()", timeout=1)
+        self.assertEqual([3, 3], [self.pool.call("add", 1, 2) for _ in range(2)])
+
+class SupervisorTest(unittest.TestCase):
+    source = "var n = 0; function inc() { return ++n; }"
+
+    def compile(self, supervisor, **kwargs):
+        return execjs.get('Node').compile(self.source, persistent=True, supervisor=supervisor, **kwargs)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(condition())
+
+    def test_prewarm_and_max_calls(self):
+        supervisor = execjs.Supervisor(prewarm=True, max_calls=3)
+        with self.compile(supervisor) as context:
+            self.wait_for(lambda: supervisor.stats['spawns'] == 1)
+            self.assertEqual([1, 2, 3, 1, 2, 3, 1], [context.call("inc") for _ in range(7)])
+            stats = supervisor.stats
+            self.assertEqual(2, stats['recycled_calls'])
+            self.assertEqual(3, stats['spawns'])
+            self.assertEqual(0, stats['respawns'])
+
+    def test_close_does_not_drain(self):
+        supervisor = execjs.Supervisor(drain_timeout=5)
+        context = self.compile(supervisor)
+        context.exec_("setInterval(function() {}, 1000)")
+        start = time.time()
+        context.close()
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(0, supervisor.stats['kills'])
+
+    def test_max_rss(self):
+        supervisor = execjs.Supervisor(max_rss=1)
+        with self.compile(supervisor) as context:
+            self.assertEqual(1, context.call("inc"))
+            self.assertEqual(1, supervisor.stats['recycled_memory'])
+            self.assertEqual(1, context.call("inc"))
+
+    def test_ping_replaces_dead_process(self):
+        supervisor = execjs.Supervisor(prewarm=True, ping_interval=0.1, ping_timeout=1)
+        with self.compile(supervisor) as context:
+            self.assertEqual(1, context.call("inc"))
+            context._worker._process.kill()
+            self.wait_for(lambda: supervisor.stats['respawns'] == 1)
+            self.assertEqual(1, supervisor.stats['ping_failures'])
+            self.assertTrue(context._worker.alive)
+            self.assertEqual(1, context.call("inc"))
+
+    def test_recycle_drains_requests_in_flight(self):
+        from concurrent.futures import ThreadPoolExecutor
+        supervisor = execjs.Supervisor(max_calls=3)
+        source = "function later(x) { return new Promise(function(resolve) { setTimeout(resolve, 50, x); }); }"
+        with execjs.get('Node').compile(source, multiplexed=True, supervisor=supervisor) as context:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                self.assertEqual(list(range(20)), list(executor.map(lambda i: context.call("later", i), range(20))))
+            self.assertGreater(supervisor.stats['recycled_calls'], 0)
+            self.assertEqual(0, supervisor.stats['kills'])
+
+
+class LimitsTest(unittest.TestCase):
+    loop = "(function() { while (true) {} })()"
+
+    def setUp(self):
+        self.runtime = execjs.get('Node')
+
+    def assertTimeout(self, func, *args, **kwargs):
+        start = time.time()
+        with self.assertRaises(execjs.TimeoutError):
+            func(*args, **kwargs)
+        self.assertLess(time.time() - start, 10)
+
+    def test_timeout(self):
+        context = self.runtime.compile("function loop() { while (true) {} }")
+        self.assertTimeout(context.eval, self.loop, timeout=1)
+        self.assertTimeout(context.call, "loop", timeout=1)
+        self.assertTimeout(self.runtime.exec_, "while (true) {}", timeout=1)
+        self.assertEqual(2, context.eval("1 + 1", timeout=10))
+
+    def test_compile_timeout(self):
+        context = self.runtime.compile("function loop() { while (true) {} }", timeout=1)
+        self.assertTimeout(context.call, "loop")
+        self.assertTimeout(context._call_once, "loop", [])
+
+    def test_timeout_recycles_persistent_process(self):
+        with self.runtime.compile("var n = 0; function inc() { return ++n; }", persistent=True) as context:
+            self.assertEqual(1, context.call("inc"))
+            self.assertTimeout(context.eval, self.loop, timeout=1)
+            self.assertEqual(1, context.call("inc"))
+
+    @unittest.skipUnless(os.name == 'posix', "resource limits are POSIX only")
+    def test_max_cpu_seconds(self):
+        self.assertTimeout(self.runtime.eval, self.loop, max_cpu_seconds=1)
+
+    @unittest.skipUnless(os.name == 'posix', "resource limits are POSIX only")
+    def test_max_memory(self):
+        hog = "(function() { var a = []; while (true) { a.push(new Array(1e6).fill(1)); } })()"
+        with self.assertRaises(execjs.RuntimeError):
+            self.runtime.eval(hog, max_memory=300 * 1024 * 1024, timeout=30)
+        self.assertEqual(2, self.runtime.eval("1 + 1", max_memory=300 * 1024 * 1024))
+
+    @unittest.skipUnless(os.name == 'posix' and six.PY3, "sessions are started by Popen on POSIX and Python 3")
+    def test_preexec_fn_only_for_resource_limits(self):
+        from execjs._limits import Limits
+        self.assertEqual({}, Limits().popen_options())
+        self.assertEqual({"start_new_session": True}, Limits(timeout=1).popen_options())
+        self.assertEqual(["preexec_fn", "start_new_session"], sorted(Limits(max_memory=2 ** 30).popen_options()))
+
+class InstrumentationTest(unittest.TestCase):
+    source = "function add(x, y) { return x + y; }"
+
+    def setUp(self):
+        self.events = []
+        self.stats = execjs.Stats()
+        execjs.add_listener(self.events.append)
+        execjs.add_listener(self.stats)
+
+    def tearDown(self):
+        execjs.remove_listener(self.events.append)
+        execjs.remove_listener(self.stats)
+
+    def test_events(self):
+        context = execjs.get('Node').compile(self.source)
+        self.assertEqual(3, context.call("add", 1, 2))
+        with self.assertRaises(execjs.ProgramError):
+            context.eval("missing")
+
+        call, error = self.events
+        self.assertEqual(("Node.js (V8)", "call", "add"), (call.runtime, call.op, call.name))
+        self.assertEqual({"compile", "spawn", "first_byte", "execute", "decode"}, set(call.phases))
+        self.assertEqual(0, call.status)
+        self.assertGreater(call.output_bytes, 0)
+        self.assertIsNone(call.error)
+        self.assertEqual(("eval", None), (error.op, error.name))
+        self.assertIsInstance(error.error, execjs.ProgramError)
+
+    def test_persistent_events(self):
+        with execjs.get('Node').compile(self.source, persistent=True) as context:
+            context.call("add", 1, 2)
+            context.call("add", 1, 2)
+        first, second = self.events
+        self.assertIn("load", first.phases)
+        self.assertEqual({"first_byte", "execute", "decode"}, set(second.phases))
+
+    @unittest.skipIf(six.PY2, "assertLogs needs Python 3")
+    def test_failing_listener(self):
+        def fail(event):
+            raise ValueError("listener")
+        context = execjs.get('Node').compile(self.source)
+        execjs.remove_listener(self.events.append)
+        execjs.add_listener(fail)
+        execjs.add_listener(self.events.append)  # after the failing listener
+        self.addCleanup(execjs.remove_listener, fail)
+        with self.assertLogs("execjs", "ERROR"):
+            self.assertEqual(3, context.call("add", 1, 2))
+            with self.assertRaises(execjs.ProgramError):
+                context.eval("missing")
+        self.assertEqual(2, len(self.events))
+
+    def test_stats(self):
+        context = execjs.get('Node').compile(self.source)
+        context.call("add", 1, 2)
+        context.call("add", 3, 4)
+        series, = self.stats.snapshot()
+        self.assertEqual(("call", "add", 2, 0), (series["op"], series["name"], series["count"], series["errors"]))
+        self.assertEqual(2, sum(count for bound, count in series["histogram"]))
+        self.assertIsNone(series["histogram"][-1][0])
+        self.stats.reset()
+        self.assertEqual([], self.stats.snapshot())
+
+class ServeTest(unittest.TestCase):
+    requests = [
+        {"call": "add", "args": [1, 2], "id": 1},
+        {"eval": "add(2, 3)", "id": 2},
+        {"eval": "missing", "id": 3},
+    ]
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix=".js")
+        with os.fdopen(fd, "w") as fp:
+            fp.write("function add(x, y) { return x + y; }")
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def serve(self, *options):
+        import subprocess
+        input = "".join(json.dumps(request) + "\n" for request in self.requests) + "\nnot json\n"
+        p = subprocess.Popen(
+            [sys.executable, "-m", "execjs", "--serve", "-r", "Node", self.filename] + list(options),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        output, _ = p.communicate(input)
+        self.assertEqual(0, p.returncode)
+        return [json.loads(line) for line in output.splitlines()]
+
+    def test_serve(self):
+        responses = self.serve()
+        self.assertEqual([{"id": 1, "result": 3}, {"id": 2, "result": 5}], responses[:2])
+        self.assertEqual(("ProgramError", 3), (responses[2]["error"], responses[2]["id"]))
+        self.assertNotIn("id", responses[3])
+        self.assertIn("error", responses[3])
+
+    def test_serve_parallel(self):
+        self.requests = [{"call": "add", "args": [i, i], "id": i} for i in range(50)]
+        responses = self.serve("-j", "3")[:-1]
+        self.assertEqual([{"id": i, "result": i * 2} for i in range(50)], responses)
+        responses = self.serve("-j", "3", "--unordered")
+        self.assertEqual(51, len(responses))
+        self.assertEqual(list(range(50)), sorted(r["id"] for r in responses if "id" in r))
+
+    def test_serve_unordered_writes_responses_as_they_complete(self):
+        slow = "(function() { var t = Date.now(); while (Date.now() - t < 500) {} return 0; })()"
+        self.requests = [{"eval": slow, "id": 0}, {"call": "add", "args": [0, 1], "id": 1}]
+        responses = self.serve("-j", "2", "--unordered")
+        self.assertEqual([1, 0], [r["id"] for r in responses if "id" in r])
+
+class CodeCacheTest(unittest.TestCase):
+    source = "var n = 0; function inc() { return ++n; }"
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.runtime = execjs.get('Node')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_code_cache(self):
+        context = self.runtime.compile(self.source, cache_dir=self.cache_dir)
+        self.assertEqual(1, context.call("inc"))
+        self.assertEqual((0, 1), (context.code_cache.hits, context.code_cache.misses))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        context = self.runtime.compile(self.source, cache_dir=self.cache_dir)
+        self.assertEqual(1, context.call("inc"))
+        self.assertEqual((1, 1), (context.code_cache.hits, context.code_cache.misses))
+
+    def test_persistent_code_cache(self):
+        for _ in range(2):
+            with self.runtime.compile(self.source, cache_dir=self.cache_dir, persistent=True) as context:
+                self.assertEqual(1, context.call("inc"))
+                self.assertEqual(2, context.call("inc"))
+        self.assertEqual((1, 1), (context.code_cache.hits, context.code_cache.misses))
+
+    def test_rejected_code_cache_is_a_miss(self):
+        for persistent in (False, True):
+            with self.runtime.compile(self.source, cache_dir=self.cache_dir, persistent=persistent) as context:
+                path = context._code_cache_path
+                with open(path, "wb") as f:
+                    f.write(b"not a code cache")
+                misses = context.code_cache.misses
+                self.assertEqual(1, context.call("inc"))
+                self.assertEqual(misses + 1, context.code_cache.misses)
+                with open(path, "rb") as f:
+                    self.assertNotEqual(b"not a code cache", f.read())
+
+class ResultCacheTest(unittest.TestCase):
+    source = "var n = 0; function inc(x) { return {x: x, n: ++n}; }"
+
+    def compile(self, cache):
+        return execjs.get('Node').compile(self.source, persistent=True, cache=cache)
+
+    def test_pure_calls_are_cached(self):
+        cache = execjs.LRU()
+        with self.compile(cache) as context:
+            self.assertEqual({"x": 1, "n": 1}, context.call("inc", 1, pure=True))
+            self.assertEqual({"x": 1, "n": 1}, context.call("inc", 1, pure=True))
+            self.assertEqual({"x": 2, "n": 2}, context.call("inc", 2, pure=True))
+            self.assertEqual({"x": 1, "n": 3}, context.call("inc", 1))
+            self.assertEqual(4, context.eval("n = 4", pure=True))
+            self.assertEqual(4, context.eval("n = 4", pure=True))
+            self.assertEqual({"x": 1, "n": 5}, context.eval("inc(1)"))
+        self.assertEqual(dict(hits=2, misses=3, evictions=0, entries=3, bytes=cache.stats['bytes']), cache.stats)
+
+    def test_shared_between_contexts(self):
+        cache = execjs.LRU()
+        with self.compile(cache) as context:
+            context.call("inc", 1, pure=True)
+        with self.compile(cache) as context:
+            self.assertEqual({"x": 1, "n": 1}, context.call("inc", 1, pure=True))
+        self.assertEqual(1, cache.hits)
+
+    def test_invalidate(self):
+        cache = execjs.LRU()
+        with self.compile(cache) as context:
+            context.call("inc", 1, pure=True)
+            context.invalidate("inc")
+            self.assertEqual({"x": 1, "n": 2}, context.call("inc", 1, pure=True))
+            cache.clear()
+            self.assertEqual(0, len(cache))
+
+    def test_eviction(self):
+        cache = execjs.LRU(maxsize=2)
+        for key in "abc":
+            cache.put((key,), key)
+        self.assertEqual((False, None), cache.get(("a",)))
+        self.assertEqual((True, "c"), cache.get(("c",)))
+        self.assertEqual(1, cache.evictions)
+
+        cache = execjs.LRU(max_bytes=10)
+        cache.put(("a",), "x" * 5)
+        cache.put(("b",), "x" * 5)
+        self.assertEqual(["b"], [k for k, in cache._entries])
+        cache.put(("c",), "x" * 20)
+        self.assertEqual(1, len(cache))
+
+    def test_ttl(self):
+        cache = execjs.LRU(ttl=0.01)
+        cache.put(("a",), 1)
+        time.sleep(0.05)
+        self.assertEqual((False, None), cache.get(("a",)))
+        self.assertEqual(0, cache.stats['bytes'])
+
+    def test_unexpected_keyword(self):
+        with self.assertRaises(TypeError):
+            execjs.compile("").call("f", bogus=True)
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio with async/await is not available")
+class AsyncTest(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.runtime = execjs.get('Node')
+
+    def tearDown(self):
+        self.asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_eval_async(self):
+        self.assertEqual(3, self.run_async(self.runtime.eval_async("1 + 2")))
+        self.assertEqual("hello", self.run_async(self.runtime.exec_async("return 'hello'")))
+
+    def test_call_async(self):
+        context = self.runtime.compile("function add(x, y) { return x + y; }")
+        coroutines = [context.call_async("add", i, i) for i in range(5)]
+        results = self.run_async(self.asyncio.gather(*coroutines))
+        self.assertEqual([0, 2, 4, 6, 8], results)
+        with self.assertRaises(execjs.ProgramError):
+            self.run_async(context.call_async("missing"))
+
+    def test_persistent_call_async(self):
+        with self.runtime.compile("function add(x, y) { return x + y; }", persistent=True) as context:
+            self.assertEqual(3, self.run_async(context.call_async("add", 1, 2)))
+
+    def test_limits_and_events(self):
+        events = []
+        execjs.add_listener(events.append)
+        self.addCleanup(execjs.remove_listener, events.append)
+        for options in ({}, {'persistent': True}, {'multiplexed': True}):
+            with self.runtime.compile("function spin() { for (;;) {} }", **options) as context:
+                with self.assertRaises(execjs.TimeoutError):
+                    self.run_async(context.call_async("spin", timeout=0.5))
+                self.assertEqual(3, self.run_async(context.eval_async("1 + 2", timeout=5)))
+        self.assertEqual(['call', 'eval'] * 3, [event.op for event in events])
+        self.assertIsInstance(events[0].error, execjs.TimeoutError)
+        self.assertEqual("spin", events[0].name)
+        with self.assertRaises(TypeError):
+            context.call_async("spin", pure=True)
+
+    def test_cancel(self):
+        for persistent in (False, True):
+            with self.runtime.compile("function spin() { for (;;) {} }", persistent=persistent) as context:
+                with self.assertRaises(self.asyncio.TimeoutError):
+                    self.run_async(self.asyncio.wait_for(context.call_async("spin"), 0.5))
+                self.assertEqual(3, self.run_async(context.eval_async("1 + 2")))
+
+    def test_multiplexed_cancel_abandons_only_its_call(self):
+        from concurrent.futures import ThreadPoolExecutor
+        source = "function sleep(ms, x) { return new Promise(function(resolve) { setTimeout(resolve, ms, x); }); }"
+        with self.runtime.compile(source, multiplexed=True) as context:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                other = executor.submit(context.call, "sleep", 1000, "ok")
+                with self.assertRaises(self.asyncio.TimeoutError):
+                    self.run_async(self.asyncio.wait_for(context.call_async("sleep", 5000, "late"), 0.3))
+                self.assertEqual("ok", other.result())
+            coroutines = [context.call_async("sleep", 100, i) for i in range(50)]
+            self.assertEqual(list(range(50)), self.run_async(self.asyncio.gather(*coroutines)))
+            self.assertEqual(1, context.eval("1"))
+
+class NodeStreamingTest(unittest.TestCase):
+    source = '''
+        function* naturals() { for (var i = 0; ; i++) yield {i: i}; }
+        function* failing() { yield 1; throw new Error("broken"); }
+    '''
+
+    def check_streaming(self, context):
+        import itertools
+        items = context.call_iter("naturals")
+        self.assertEqual([{"i": 0}, {"i": 1}, {"i": 2}], list(itertools.islice(items, 3)))
+        items.close()
+
+        items = context.call_iter("failing")
+        self.assertEqual(1, next(items))
+        with self.assertRaises(execjs.ProgramError):
+            next(items)
+
+    def test_call_iter(self):
+        self.check_streaming(execjs.get('Node').compile(self.source))
+
+    def test_persistent_call_iter(self):
+        with execjs.get('Node').compile(self.source, persistent=True) as context:
+            self.check_streaming(context)
+            self.assertEqual(3, context.eval("1 + 2"))
+
+    def test_derived_call_iter(self):
+        with execjs.get('Node').compile("var base = 1;", persistent=True) as context:
+            derived = context.derive(self.source)
+            self.check_streaming(derived)
+            self.assertEqual(3, derived.eval("base + 2"))
+
+    def test_call_iter_without_streaming(self):
+        from execjs._abstract_runtime_context import AbstractRuntimeContext
+        context = execjs.get('Node').compile(self.source + "function* gen() { yield 1; yield 2; }")
+        self.assertEqual([1, 2], list(AbstractRuntimeContext._call_iter(context, "gen")))
+        self.assertEqual([1, 2], list(AbstractRuntimeContext._call_iter(context, "Array.of", 1, 2)))
+        with self.assertRaises(execjs.ProgramError):
+            AbstractRuntimeContext._call_iter(context, "Object")
+
+    def test_call_while_streaming(self):
+        with execjs.get('Node').compile(self.source, persistent=True) as context:
+            items = context.call_iter("naturals")
+            self.assertEqual({"i": 0}, next(items))
+            self.assertEqual(3, context.eval("1 + 2"))
+            self.assertEqual({"i": 1}, next(items))
+            items.close()
+
+@unittest.skipIf(six.PY2, "binary transfer needs Python 3")
+class NodeBinaryTest(unittest.TestCase):
+    source = '''
+        function info(b) { return [Buffer.isBuffer(b), b.length, b.toString('hex')]; }
+        function squares(n) { var a = new Float64Array(n); for (var i = 0; i < n; i++) a[i] = i * i; return a; }
+        function echo(v) { return v; }
+    '''
+
+    def test_binary_arguments(self):
+        context = execjs.get('Node').compile(self.source)
+        self.assertEqual([True, 3, "0001ff"], context.call("info", b"\x00\x01\xff"))
+        self.assertEqual([True, 2, "6162"], context.call("info", bytearray(b"ab")))
+        self.assertEqual([True, 3, "616365"], context.call("info", memoryview(b"abcdef")[::2]))
+        with self.assertRaises(TypeError):
+            context.call("echo", set())
+
+    def test_binary_call_many(self):
+        for persistent in (False, True):
+            with execjs.get('Node').compile(self.source, persistent=persistent) as context:
+                results = context.call_many("info", [(b"\x01",), (b"ab",), (None,)])
+                self.assertEqual([[True, 1, "01"], [True, 2, "6162"]], results[:2])
+                self.assertIsInstance(results[2], execjs.ProgramError)
+                self.assertEqual([1, 2], [r[1] for r in context.map("info", [b"a", b"bc"], processes=1)])
+
+    def test_binary_results_are_not_cached(self):
+        with execjs.get('Node').compile(self.source, persistent=True, cache=execjs.LRU()) as context:
+            self.assertEqual(b"ab", context.call("echo", b"ab", pure=True))
+            self.assertEqual(b"\x01", context.eval("new Uint8Array([1])", pure=True))
+            self.assertEqual(0, context._result_cache.stats["entries"])
+
+    def test_persistent_binary(self):
+        with execjs.get('Node').compile(self.source, persistent=True) as context:
+            self.assertEqual([True, 3, "0001ff"], context.call("info", b"\x00\x01\xff"))
+            self.assertEqual([b"xyz", {"k": b"\x00\x00"}], context.call("echo", [b"xyz", {"k": bytearray(2)}]))
+            self.assertEqual(b"\x01\x02", context.eval("new Uint8Array([1, 2])"))
+
+            squares = context.call("squares", 4)
+            try:
+                import numpy
+            except ImportError:
+                import struct
+                self.assertEqual(struct.pack("=4d", 0, 1, 4, 9), squares)
+            else:
+                self.assertEqual([0, 1, 4, 9], squares.tolist())
+                self.assertEqual([0, 1, 4, 9], context.call("echo", numpy.array([0, 1, 4, 9], dtype="float64")).tolist())
+                with self.assertRaises(TypeError):
+                    context.call("echo", numpy.zeros((2, 2)))
+
+    @unittest.skipIf(sys.version_info < (3, 5), "asyncio with async/await is not available")
+    def test_binary_call_async(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        context = execjs.get('Node').compile(self.source)
+        self.assertEqual([True, 3, "616263"], loop.run_until_complete(context.call_async("info", b"abc")))
+
 class NashornRuntimeTest(unittest.TestCase, RuntimeTestBase):
     def setUp(self):
         self.runtime = execjs.get('Nashorn')
@@ -103,6 +926,61 @@ class PhantomJSRuntimeTest(unittest.TestCase, RuntimeTestBase):
     def setUp(self):
         self.runtime = execjs.get('PhantomJS')
 
+class CalibrationTest(unittest.TestCase):
+    def setUp(self):
+        import execjs._calibration as calibration
+        self.calibration = calibration
+        self.cache_dir = tempfile.mkdtemp()
+        self.orig = os.environ.get("EXECJS_CALIBRATION_CACHE")
+        self.filename = os.path.join(self.cache_dir, "calibration.json")
+        os.environ["EXECJS_CALIBRATION_CACHE"] = self.filename
+        calibration._results.clear()
+
+    def tearDown(self):
+        if self.orig is None:
+            del os.environ["EXECJS_CALIBRATION_CACHE"]
+        else:
+            os.environ["EXECJS_CALIBRATION_CACHE"] = self.orig
+        self.calibration._results.clear()
+        shutil.rmtree(self.cache_dir)
+
+    def test_results_are_cached(self):
+        node = execjs.get("Node")
+        self.assertIs(node, execjs.get(policy="fastest"))
+        with open(self.filename) as fp:
+            results = json.load(fp)
+        self.assertEqual(1, len(results))
+        self.assertIn(node._version(), next(iter(results)))
+
+        probe = self.calibration._probe
+        self.calibration._probe = None  # as in a new process, which must not probe again
+        self.calibration._results.clear()
+        try:
+            self.assertIs(node, execjs.get(policy="fastest", profile="throughput"))
+        finally:
+            self.calibration._probe = probe
+
+    def test_failed_probes_are_not_saved(self):
+        broken = execjs.ExternalRuntime("Broken", ["node"], "process.exit(1)")
+        self.assertIsNone(self.calibration.calibrate("Broken", broken))
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_profiles(self):
+        fast_start = execjs.ExternalRuntime("FastStart", ["node"], execjs._runner_sources.Node)
+        fast_call = execjs.get("Node")
+        latencies = {fast_start: {"cold": 0.01, "call": 0.01}, fast_call: {"cold": 0.1, "call": 0.001}}
+        probe = self.calibration._probe
+        self.calibration._probe = lambda runtime: latencies[runtime]
+        try:
+            runtimes = [("FastStart", fast_start), ("Node", fast_call)]
+            self.assertIs(fast_start, self.calibration.select(runtimes, "startup"))
+            self.assertIs(fast_call, self.calibration.select(runtimes, "throughput"))
+        finally:
+            self.calibration._probe = probe
+        with self.assertRaises(ValueError):
+            execjs.get(policy="slowest")
+
+
 class CommonTest(unittest.TestCase):
     def test_empty_path_environ(self):
         """
@@ -126,6 +1004,38 @@ class CommonTest(unittest.TestCase):
         r = execjs.ExternalRuntime("success", ["python"], "")
         self.assertTrue(r.is_available())
 
+    def test_discovery_cache(self):
+        import execjs._discovery as discovery
+        calls = []
+
+        def find(command):
+            calls.append(command)
+            return ["/bin/" + command[0]] if command[0] == "sh" else None
+
+        cache_dir = tempfile.mkdtemp()
+        orig = os.environ.get("EXECJS_DISCOVERY_CACHE")
+        try:
+            filename = os.path.join(cache_dir, "discovery.json")
+            os.environ["EXECJS_DISCOVERY_CACHE"] = filename
+            self.assertEqual(["/bin/sh"], discovery.which(["sh"], find))
+            self.assertIsNone(discovery.which(["missing"], find))
+            self.assertTrue(os.path.exists(filename))
+
+            discovery._state.clear()  # as in a new process
+            self.assertEqual(["/bin/sh"], discovery.which(["sh"], find))
+            self.assertIsNone(discovery.which(["missing"], find))
+            self.assertEqual([["sh"], ["missing"]], calls)
+        finally:
+            if orig is None:
+                del os.environ["EXECJS_DISCOVERY_CACHE"]
+            else:
+                os.environ["EXECJS_DISCOVERY_CACHE"] = orig
+            shutil.rmtree(cache_dir)
+
+    def test_fallback_commands(self):
+        r = execjs.ExternalRuntime("fallback", ["nonexistent"], "", fallback_commands=[["python"]])
+        self.assertTrue(r.is_available())
+
     def test_attributes_export(self):
         for name in execjs.__all__:
             self.assertTrue(hasattr(execjs, name), "{} is not defined".format(name))